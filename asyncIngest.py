@@ -0,0 +1,120 @@
+from uuid import uuid4 as getUUID
+from time import perf_counter
+from neo4jUtils import pool_settings, ensureSchema, graph_backend, classify_query, profiledQuery, recordQuery
+from log import f_logger
+import memoryGraph
+import sqliteStore
+from typing import TYPE_CHECKING
+import asyncio
+
+if TYPE_CHECKING:
+    from neo4j import AsyncDriver
+
+
+def openAsyncGraph() -> "AsyncDriver":
+    """An async driver with the same credentials and pool settings as openGraph().
+    Async drivers belong to one event loop, so each ingest run opens its own."""
+    from neo4j import AsyncGraphDatabase
+    from streamlit import secrets
+    s = secrets
+    settings = {k: s.get(k.upper(), v) for k, v in pool_settings.items()}
+    return AsyncGraphDatabase.driver(s["NEO4J_URI"], auth=(s["NEO4J_USER"], s["NEO4J_PASSWORD"]), **settings)
+
+
+async def writeJob(tx, query:str, params:dict):
+    """Transaction function: run one write and hand back its summary."""
+    result = await tx.run(query, params)
+    return await result.consume()
+
+
+async def ingestJobs(jobs, concurrency:int=8, database:str="neo4j")->list:
+    """Run (name, query, params) jobs as write transactions with at most concurrency
+    in flight. Jobs are pulled from the iterable through a bounded queue, so a
+    slow server holds the producer back instead of piling work up in memory.
+    Returns the counters of every job in job order."""
+    driver = openAsyncGraph()
+    queue:asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    results:dict = {}
+
+    async def worker():
+        async with driver.session(database=database) as session:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                n, (name, query, params) = item
+                start = perf_counter()
+                summary = await session.execute_write(writeJob, profiledQuery(name, query), params)
+                recordQuery(name, params, perf_counter() - start, summary.counters, summary)
+                results[n] = summary.counters
+
+    async def producer():
+        for item in enumerate(jobs):
+            await queue.put(item)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    try:
+        await asyncio.gather(producer(), *[worker() for _ in range(concurrency)])
+    finally:
+        await driver.close()
+    return [results[n] for n in range(len(results))]
+
+
+def runJobs(jobs, concurrency:int=8, database:str="neo4j")->list:
+    """Synchronous entry point to ingestJobs. With the memory or sqlite backend 
+    active the jobs run one after another against it instead, as in runQuery; 
+    the read-only sqlite store refuses them."""
+    logger = f_logger()
+    start = perf_counter()
+    if graph_backend['name'] in ("memory", "sqlite"):
+        backend = memoryGraph if graph_backend['name'] == "memory" else sqliteStore
+        counters:list = []
+        for name, _, params in jobs:
+            job_start = perf_counter()
+            counters.append(backend.runOperation(name, params)[1])
+            recordQuery(name, params, perf_counter() - job_start, counters[-1])
+    else:
+        ensureSchema(database)
+        counters:list = asyncio.run(ingestJobs(jobs, concurrency, database))
+    elapsed = perf_counter() - start
+    logger.success("{} write transactions in {:.1f}s ({:.1f}/s).",
+        len(counters), elapsed, len(counters) / elapsed if elapsed else 0.0)
+    return counters
+
+
+subject_query:str = """
+                    CREATE (m:subject { title:$main, uuid: $muuid } )
+                    WITH m
+                    UNWIND $subs AS sub
+                    CREATE (s:subject { title:sub.title, uuid: sub.uuid })-[:parent {relationGloss: "variant of", inverseGloss:"has variant"}]->(m)
+                    WITH s, sub
+                    UNWIND sub.atus AS atu
+                    MATCH (a:atu {atu:atu})
+                    CREATE (a)-[:subject {relationGloss: "involves subject", inverseGloss:"appears in type"}]->(s)
+                    """
+
+
+def subjectJob(main:str, subs:dict)->tuple:
+    """One transaction creating a subject, its sub-entries and their ATU links."""
+    return "createSubjectTree", subject_query, {'main': main, 'muuid': str(getUUID()),
+                           'subs': [{'title': k, 'uuid': str(getUUID()), 'atus': v} for k, v in subs.items()]}
+
+
+def createAndLinkSubjects(main:str, subs:dict)->int:
+    """Sync wrapper with the signature of neo4jUtils.createAndLinkSubjects."""
+    return sum(c.relationships_created for c in runJobs([subjectJob(main, subs)], 1))
+
+
+def createAndLinkAllSubjects(subjects:dict, concurrency:int=8)->int:
+    """Create every subject of subjects.json, concurrency transactions at a time."""
+    jobs = (subjectJob(k, v['entries']) for k, v in subjects.items())
+    return sum(c.relationships_created for c in runJobs(jobs, concurrency))
+
+
+def classifyATUs(atu_dict:dict, concurrency:int=8)->int:
+    """Sync wrapper with the signature of neo4jUtils.classifyATUs, running the
+    per-class writes concurrently."""
+    jobs = (("classifyATUs", classify_query, {'atus': v, 'cls': k}) for k, v in atu_dict.items())
+    return sum(c.relationships_created for c in runJobs(jobs, concurrency))
+
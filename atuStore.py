@@ -0,0 +1,114 @@
+from bisect import bisect_left
+from functools import lru_cache
+from math import inf
+from os import stat
+from re import compile
+from sys import intern
+
+
+atu_file:str = "data/atu.json"
+atu_fields:tuple = ("atu", "title", "description", "remarks", "motifs", "combos",
+                    "strongCombos", "cf", "literature")
+
+
+class ATU:
+    """One entry of atu.json. Fields live in slots rather than a per-entry dict;
+    lists become tuples and the tradition names keying the literature are
+    interned. Reads like the dict it replaces: a['atu'], a.get('remarks'),
+    'combos' in a, a.items()."""
+    __slots__ = atu_fields
+
+    def __init__(self, entry:dict):
+        for k, v in entry.items():
+            if isinstance(v, list):
+                v = tuple(v)
+            elif isinstance(v, dict):
+                v = {intern(t): tuple(r) if isinstance(r, list) else r for t, r in v.items()}
+            setattr(self, k, v)
+
+    def __getitem__(self, key:str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key:str)->bool:
+        return hasattr(self, key)
+
+    def get(self, key:str, default=None):
+        return getattr(self, key, default)
+
+    def items(self):
+        return ((k, getattr(self, k)) for k in atu_fields if hasattr(self, k))
+
+
+@lru_cache(maxsize=1)
+def readATUs(file_name:str, mtime_ns:int, size:int)->tuple:
+    """Parse atu.json once per file version into records in file order and an
+    index from ATU number to positions (some numbers occur twice). Entries are
+    converted as they are read from the compiled corpus cache, so the file is
+    never held as dicts all at once."""
+    from corpusCache import corpusName, iterCorpus
+    name:str = corpusName(file_name)
+    if name is not None:
+        source = iterCorpus(name)
+    else:
+        from neo4jUtils import iterJSONArray
+        source = iterJSONArray(file_name)
+    records:tuple = tuple(ATU(a) for a in source)
+    index:dict = {}
+    for i, a in enumerate(records):
+        index.setdefault(a.atu, []).append(i)
+    return records, index
+
+
+def atuDataset(file_name:str=atu_file)->tuple:
+    """The cached (records, index) for file_name, reloaded only if the file changed."""
+    st = stat(file_name)
+    return readATUs(file_name, st.st_mtime_ns, st.st_size)
+
+
+def atuRecords(file_name:str=atu_file)->tuple:
+    """Every ATU in file order."""
+    return atuDataset(file_name)[0]
+
+
+def atusByID(atu:str, file_name:str=atu_file)->list[ATU]:
+    """Every entry with this ATU number, in file order."""
+    records, index = atuDataset(file_name)
+    return [records[i] for i in index.get(atu, [])]
+
+
+def atuByID(atu:str, file_name:str=atu_file)->ATU:
+    """The first entry with this ATU number, or None."""
+    found:list[ATU] = atusByID(atu, file_name)
+    return found[0] if found else None
+
+
+atu_number = compile(r"([0-9]+)([A-Z\*]*)")
+
+
+def atuKey(atu:str)->tuple:
+    """An exact sort key for an ATU number: the number, then one rank per
+    suffix character, * as 0 and A-Z as 1-26, so that 510 < 510* < 510A <
+    510A* < 510B. A range like "1030A*–C*" sorts by its first type. None if
+    atu does not start with a number."""
+    g = atu_number.match(atu)
+    if g is None:
+        return None
+    return (int(g.group(1)),) + tuple(0 if c == "*" else ord(c) - 64 for c in g.group(2))
+
+
+def leafIndex(leaves:list[dict])->dict:
+    """An interval index over the leaf classes of the outline, in outline
+    order, by the key just above their upper bound."""
+    return {'uppers': [(int(l['upper']), inf) for l in leaves], 'leaves': leaves}
+
+
+def leafFor(atu:str, index:dict)->dict:
+    """The first leaf class whose upper bound reaches atu, or None."""
+    key:tuple = atuKey(atu)
+    if key is None:
+        return None
+    i:int = bisect_left(index['uppers'], key)
+    return index['leaves'][i] if i < len(index['leaves']) else None
@@ -0,0 +1,290 @@
+from csv import writer
+from json import load
+from os import makedirs, path
+from uuid import uuid4 as getUUID
+from neo4jUtils import label_dicts, iterJSONArray, cleanTargets, retiredLinks
+from atuStore import atuRecords, leafIndex, leafFor
+from log import f_logger
+
+
+# Header rows for the neo4j-admin import files. Each label gets its own ID space
+# so that ATU numbers, motif codes and citation keys cannot collide.
+node_headers:dict = {
+    'atu': ["atu:ID(atu)", "title", "description", "remarks", ":LABEL"],
+    'motif': ["motif:ID(motif)", "description", "additional_description", ":LABEL"],
+    'ref': ["ref:ID(ref)", "citation", ":LABEL"],
+    'class': ["uuid:ID(class)", "title", "lower", "upper", "nodeLabel", ":LABEL"],
+    'tradition': [":ID(tradition)", "title", ":LABEL"],
+    'subject': ["uuid:ID(subject)", "title", ":LABEL"],
+    'citation': [":ID(citation)", "from", ":LABEL"],
+                }
+
+rel_ends:dict = {
+    'motifs': ("atu", "motif"),
+    'superclass': ("class", "class"),
+    'class': ("atu", "class"),
+    'tradition_class': ("tradition", "class"),
+    'discontinued': ("atu", "atu"),
+    'combo': ("atu", "atu"),
+    'parent': ("subject", "subject"),
+    'subject': ("atu", "subject"),
+    'see': ("subject", "subject"),
+    'literature': ("atu", "citation"),
+    'reference': ("citation", "ref"),
+    'tradition': ("citation", "tradition"),
+                }
+
+# The glosses neo4jUtils assigns to the same relationships when loading over Bolt.
+glosses:dict = {
+    'superclass': ["subclass of", "superclass of"],
+    'class': ["member of", "includes"],
+    'tradition_class': ["member of", "includes"],
+    'discontinued': ["merged into", "absorbed"],
+    'combo': ["sometimes combined with", "sometimes combined with"],
+    'parent': ["variant of", "has variant"],
+    'subject': ["involves subject", "appears in type"],
+    'see': ["see also", "see also"],
+    'literature': ["has relevant literature", "concerns or features"],
+    'reference': ["full citation", "cited as"],
+    'tradition': ["documents or analyzes", "is featured in"],
+                }
+
+tradition_root:dict = {'title': "Tradition", 'uuid': "58e1b5dc-4010-431e-bcf7-d84b62e69d0c"}
+retired:str = "Combined with another type as per title."
+
+
+def openImportFiles(out_dir:str)->dict:
+    """Open one CSV writer per node label and relationship type and write the
+    headers neo4j-admin expects."""
+    makedirs(out_dir, exist_ok=True)
+    files:dict = {'dir': out_dir, 'handles': {}, 'writers': {}, 'counts': {}}
+    headers:dict = {"nodes_" + k: v for k, v in node_headers.items()}
+    for k, (start, end) in rel_ends.items():
+        headers["relationships_" + k] = [":START_ID({})".format(start), ":END_ID({})".format(end),
+                                         ":TYPE", "relationGloss", "inverseGloss"]
+    for name, h in headers.items():
+        f = open(path.join(out_dir, name + ".csv"), 'w', encoding="utf-8", newline="")
+        files['handles'][name] = f
+        files['writers'][name] = writer(f)
+        files['writers'][name].writerow(h)
+        files['counts'][name] = 0
+    return files
+
+
+def writeNode(files:dict, label:str, row:list, labels:str=None):
+    """Stream one node row, with labels (";"-separated) if not just label."""
+    name:str = "nodes_" + label
+    files['writers'][name].writerow(row + [labels or label])
+    files['counts'][name] += 1
+
+
+def writeRel(files:dict, name:str, start:str, end:str, gloss:list=None):
+    """Stream one relationship row. The type is the file name, except for the
+    tradition memberships, which are 'class' relationships like the ATU ones."""
+    rel_type:str = "class" if name == "tradition_class" else name
+    row:list = [start, end, rel_type] + (gloss if gloss is not None else glosses[name])
+    files['writers']["relationships_" + name].writerow(row)
+    files['counts']["relationships_" + name] += 1
+
+
+def closeImportFiles(files:dict)->dict:
+    """Close every file and return the row counts."""
+    for f in files['handles'].values():
+        f.close()
+    return files['counts']
+
+
+def importCommand(files:dict, database:str="neo4j")->str:
+    """The neo4j-admin invocation that loads the exported files."""
+    args:list[str] = ["neo4j-admin database import full {}".format(database),
+                      "--skip-bad-relationships=true", "--skip-duplicate-nodes=true",
+                      "--multiline-fields=true"]
+    for name in files['handles']:
+        kind, label = name.split("_", 1)
+        file_name:str = path.join(files['dir'], name + ".csv")
+        if kind == "nodes":
+            args.append("--nodes={}={}".format(label, file_name))
+        else:
+            args.append("--relationships={}".format(file_name))
+    return " \\\n    ".join(args)
+
+
+def outlineClasses(file_name:str="data/ATU_outline.txt")->tuple:
+    """Read the ATU outline into class nodes, superclass links and the leaf
+    classes (in outline order) that ATUs are filed under."""
+    root:dict = {'title': "ATU", 'uuid': str(getUUID()), 'nodeLabel': "atu"}
+    classes:list[dict] = [root]
+    links:list[tuple] = []
+    leaves:list[dict] = []
+    parents:dict = {0: root}
+    with open(file_name, 'r', encoding="utf-8") as f:
+        lines:list[str] = [l for l in f if l.strip() != ""]
+    for n, l in enumerate(lines):
+        level:int = l.count("*")
+        atuClass:dict = {'uuid': str(getUUID())}
+        spl:list[str] = l.strip("*\n ").split()
+        if level > 1:
+            bounds:list[str] = spl[-1].split("-")
+            atuClass['lower'] = bounds[0]
+            atuClass['upper'] = bounds[1]
+            spl = spl[:-1]
+        atuClass['title'] = " ".join(spl)
+        classes.append(atuClass)
+        links.append((atuClass['uuid'], parents[level - 1]['uuid']))
+        parents[level] = atuClass
+        next_level:int = lines[n + 1].count("*") if n + 1 < len(lines) else 0
+        if level > 1 and next_level <= level:
+            leaves.append(atuClass)
+    return classes, links, leaves
+
+
+def exportATUs(files:dict, leaves:list[dict], discontinued_class:dict)->dict:
+    """Stream atu.json into ATU nodes, motif edges and class memberships,
+    keeping back only what the later relationship passes need."""
+    logger = f_logger()
+    rel_def:dict = label_dicts['atu']['motifs']
+    index:dict = leafIndex(leaves)
+    seen:set[str] = set()
+    combos:dict = {}
+    retired_atus:list[dict] = []
+    for a in iterJSONArray(label_dicts['atu']['file']):
+        atu:str = a['atu']
+        if atu in seen:
+            logger.warning("Duplicate ATU {} left out of the node file.", atu)
+            continue
+        seen.add(atu)
+        writeNode(files, 'atu', [atu, a.get('title', ""), a.get('description', ""), a.get('remarks', "")])
+        for t in cleanTargets(a.get('motifs', []), rel_def['props']):
+            writeRel(files, 'motifs', atu, t['id'],
+                     [t['props']['relationGloss'], t['props']['inverseGloss']])
+        if a.get('description') == retired:
+            retired_atus.append({'discontinued': atu, 'title': a.get('title', "")})
+            writeRel(files, 'class', atu, discontinued_class['uuid'])
+        else:
+            leaf:dict = leafFor(atu, index)
+            if leaf is not None:
+                writeRel(files, 'class', atu, leaf['uuid'])
+        if a.get('combos'):
+            combos[atu] = a['combos']
+    return {'combos': combos, 'retired': retired_atus}
+
+
+def exportKeyed(files:dict, label:str)->set[str]:
+    """Stream a label_dicts source file (motifs, refs) into a node file,
+    keeping the first of any repeated key. Returns the keys exported."""
+    label_dict:dict = label_dicts[label]
+    seen:set[str] = set()
+    if not path.exists(label_dict['file']):
+        f_logger().warning("{} not found; no {} nodes exported.", label_dict['file'], label)
+        return seen
+    for x in iterJSONArray(label_dict['file']):
+        key:str = x.get(label_dict['key'])
+        if key and key not in seen:
+            seen.add(key)
+            writeNode(files, label, [x.get(p, "") for p in label_dict['props']])
+    return seen
+
+
+def exportTraditions(files:dict, file_name:str="data/traditions.json")->dict:
+    """Tradition classes under the fixed Tradition root, as classifyTraditions
+    creates them, with one tradition node per continent entry. Returns the
+    ids of the tradition nodes by title."""
+    trad_ids:dict = {}
+    for d in iterJSONArray(file_name):
+        continent:str = d['continent']
+        suffix = "an" if continent == "Europe" else "n"
+        cuuid = str(getUUID())
+        writeNode(files, 'class', [cuuid, continent + suffix + " Tradition", "", "", ""])
+        writeRel(files, 'superclass', cuuid, tradition_root['uuid'])
+        for trad in dict.fromkeys(d['traditions']):
+            tid:str = "{}/{}".format(continent, trad)
+            writeNode(files, 'tradition', [tid, trad])
+            writeRel(files, 'tradition_class', tid, cuuid)
+            trad_ids.setdefault(trad, []).append(tid)
+    return trad_ids
+
+
+def exportCitations(files:dict, refs:set[str], trad_ids:dict):
+    """The citations of every exported ATU as attachATUs2Citations creates
+    them: one citation node per cleaned literature entry whose ref was
+    exported, linked from its ATU, to its ref and to every tradition of that
+    name (a citation per tradition, as the loaders match them)."""
+    from parsing import atuRefs
+    logger = f_logger()
+    seen:set[str] = set()
+    n:int = 0
+    for a in atuRecords():
+        if a['atu'] in seen or a.get('literature') is None:
+            continue
+        seen.add(a['atu'])
+        for trad, trad_refs in atuRefs(a, logger).items():
+            for tid in trad_ids.get(trad) or [None]:
+                for ref in trad_refs:
+                    if ref['citation'] not in refs:
+                        continue
+                    n += 1
+                    cid:str = str(n)
+                    writeNode(files, 'citation', [cid, ref['raw']], "citation;EXP")
+                    writeRel(files, 'literature', a['atu'], cid)
+                    writeRel(files, 'reference', cid, ref['citation'])
+                    if tid is not None:
+                        writeRel(files, 'tradition', cid, tid)
+
+
+def exportSubjects(files:dict, file_name:str="data/subjects.json"):
+    """Subjects, sub-entries and their ATUs as createAndLinkSubjects writes
+    them, plus the undirected see-also links of linkSubjects."""
+    with open(file_name, "r", encoding='utf-8') as f:
+        subjects:dict = load(f)
+    mains:dict = {}
+    for main, v in subjects.items():
+        muuid = str(getUUID())
+        mains[main] = muuid
+        writeNode(files, 'subject', [muuid, main])
+        for sub, sub_atus in v['entries'].items():
+            suuid = str(getUUID())
+            writeNode(files, 'subject', [suuid, sub])
+            writeRel(files, 'parent', suuid, muuid)
+            for atu in sub_atus:
+                writeRel(files, 'subject', atu, suuid)
+    linked:set = set()
+    for main, v in subjects.items():
+        for cf in v.get('cfs', []):
+            pair = frozenset([main, cf])
+            if cf in mains and pair not in linked:
+                linked.add(pair)
+                writeRel(files, 'see', mains[main], mains[cf])
+
+
+def exportBulk(out_dir:str="import")->dict:
+    """Turn the bundled JSON corpora and ATU outline into node and relationship
+    CSVs for `neo4j-admin database import`, streaming each file as it goes.
+    Covers the layers the loaders build, citations with their literature,
+    reference and tradition links included. Source data is only read."""
+    logger = f_logger()
+    files:dict = openImportFiles(out_dir)
+    classes, links, leaves = outlineClasses()
+    discontinued_class:dict = {'title': "Discontinued ATU", 'uuid': str(getUUID())}
+    for c in classes + [discontinued_class, tradition_root]:
+        writeNode(files, 'class', [c['uuid'], c['title'], c.get('lower', ""),
+                                   c.get('upper', ""), c.get('nodeLabel', "")])
+    for child, parent in links + [(discontinued_class['uuid'], classes[0]['uuid'])]:
+        writeRel(files, 'superclass', child, parent)
+    found:dict = exportATUs(files, leaves, discontinued_class)
+    for d, a in retiredLinks(found['retired'])[0].items():
+        writeRel(files, 'discontinued', d, a)
+    linked:set = set()
+    for atu0, partners in found['combos'].items():
+        for atu1 in partners:
+            pair = frozenset([atu0, atu1])
+            if pair not in linked:
+                linked.add(pair)
+                writeRel(files, 'combo', atu0, atu1)
+    exportKeyed(files, 'motif')
+    refs:set[str] = exportKeyed(files, 'ref')
+    trad_ids:dict = exportTraditions(files)
+    exportCitations(files, refs, trad_ids)
+    exportSubjects(files)
+    counts:dict = closeImportFiles(files)
+    logger.success("Exported {} for bulk import:\n{}", counts, importCommand(files))
+    return counts
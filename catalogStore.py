@@ -0,0 +1,115 @@
+from json import dump, load
+from os import environ, makedirs, path, replace, stat
+from shutil import copyfile
+from time import time
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+from pandas import DataFrame, read_csv, read_parquet
+from log import f_logger
+import requests
+
+
+# The Gutenberg catalog is kept on disk: the download as served, its validators
+# and a Parquet copy of the columns the app uses. It is refreshed with a 
+# conditional request at most once per max_age seconds, so a cold start reads 
+# the Parquet file and an unchanged catalog is never downloaded or parsed again.
+# ENTALEMENTS_CATALOG_URL may point at a mirror, including a file:// URL.
+catalog_settings:dict = {
+    'url': environ.get("ENTALEMENTS_CATALOG_URL", "https://www.gutenberg.org/cache/epub/feeds/pg_catalog.csv.gz"),
+    'dir': "data/.catalog",
+    'max_age': 24 * 3600,
+    'columns': ["Text#", "Type", "Title", "Language", "Authors", "Subjects", "LoCC", "Bookshelves"],
+    'categories': ["Type", "Language", "LoCC"],
+                        }
+
+
+def catalogPath(name:str)->str:
+    return path.join(catalog_settings['dir'], name)
+
+
+def readCatalogMeta()->dict:
+    if not path.exists(catalogPath("meta.json")):
+        return {}
+    with open(catalogPath("meta.json"), "r", encoding='utf-8') as f:
+        return load(f)
+
+
+def writeCatalogMeta(meta:dict):
+    with open(catalogPath("meta.json.tmp"), 'w', encoding="utf-8") as f:
+        dump(meta, f, indent=1)
+    replace(catalogPath("meta.json.tmp"), catalogPath("meta.json"))
+
+
+def fetchCatalog(meta:dict)->bool:
+    """Download the catalog to disk unless the copy there is current. Over HTTP 
+    this is a conditional request on the ETag and Last-Modified of the last 
+    download, streamed to a temporary file; a file:// mirror is compared by 
+    mtime and size. Returns whether a new catalog was written."""
+    url:str = catalog_settings['url']
+    raw:str = catalogPath("pg_catalog.download")
+    known:bool = path.exists(raw) and meta.get('url') == url
+    parts = urlparse(url)
+    if parts.scheme == "file":
+        source:str = url2pathname(parts.path)
+        st_source = stat(source)
+        stamp:str = "{}-{}".format(st_source.st_mtime_ns, st_source.st_size)
+        if known and meta.get('etag') == stamp:
+            return False
+        copyfile(source, raw + ".tmp")
+        meta.update({'etag': stamp, 'last_modified': None})
+    else:
+        headers:dict = {}
+        if known and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if known and meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        with requests.get(url, headers=headers, stream=True, timeout=60) as r:
+            if r.status_code == 304:
+                return False
+            r.raise_for_status()
+            with open(raw + ".tmp", 'wb') as f:
+                for block in r.iter_content(1 << 20):
+                    f.write(block)
+            meta.update({'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified')})
+    replace(raw + ".tmp", raw)
+    meta['url'] = url
+    return True
+
+
+def parseCatalog(file_name:str)->DataFrame:
+    """Read the columns the app uses from a downloaded catalog, decompressing 
+    as it goes, with the repetitive ones as categoricals."""
+    with open(file_name, 'rb') as f:
+        gzipped:bool = f.read(2) == b"\x1f\x8b"
+    return read_csv(file_name, usecols=catalog_settings['columns'],
+                    dtype={c: "category" for c in catalog_settings['categories']},
+                    compression="gzip" if gzipped else None, encoding="utf-8")
+
+
+def loadCatalog(refresh:bool=None)->DataFrame:
+    """The catalog from local disk, refreshed first if it was last checked more 
+    than max_age ago (or if refresh is True). If the refresh fails, the copy 
+    on disk is used when there is one."""
+    logger = f_logger()
+    makedirs(catalog_settings['dir'], exist_ok=True)
+    meta:dict = readCatalogMeta()
+    table:str = catalogPath("pg_catalog.parquet")
+    if refresh is None:
+        refresh = not path.exists(table) or time() - meta.get('checked', 0) > catalog_settings['max_age']
+    changed:bool = False
+    if refresh:
+        try:
+            changed = fetchCatalog(meta)
+            meta['checked'] = time()
+        except (OSError, requests.RequestException) as e:
+            if not path.exists(table):
+                raise
+            logger.warning("Could not refresh the catalog, using the copy from disk: {!r}", e)
+    if changed or not path.exists(table):
+        catalog:DataFrame = parseCatalog(catalogPath("pg_catalog.download"))
+        catalog.to_parquet(table + ".tmp")
+        replace(table + ".tmp", table)
+        logger.success("Catalog updated: {} entries.", len(catalog))
+    if refresh:
+        writeCatalogMeta(meta)
+    return read_parquet(table)
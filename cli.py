@@ -0,0 +1,246 @@
+from argparse import ArgumentParser, REMAINDER
+from os import path
+import sys
+
+# The parsers live in data/ and import each other by bare name.
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), "data"))
+
+
+# Every handler imports what it needs when it runs, so that the CLI itself and
+# the cheap commands start without loading pypdf, the Neo4j driver or streamlit.
+
+
+def parseATUs(args):
+    from parsing import atuParser
+    return atuParser()
+
+
+def parseTraditions(args):
+    from parsing import tradsParser
+    return tradsParser()
+
+
+def parseSources(args):
+    from parsing import sourcesParser
+    return sourcesParser()
+
+
+def parseSubjects(args):
+    from parsing import parseSubjects2tsv, parseSubjects2json
+    return parseSubjects2json() if args.json else parseSubjects2tsv()
+
+
+def tmiRefs(args):
+    from parsing import buildTMIrefs
+    return buildTMIrefs()
+
+
+def tmiTraditions(args):
+    from parsing import collectMotifReferenceElements
+    return collectMotifReferenceElements()
+
+
+def exportBulk(args):
+    from bulkImport import exportBulk
+    return exportBulk(args.out)
+
+
+def lookup(args):
+    from corpusCache import corpusLookup
+    from json import dumps
+    return "\n".join(dumps(r, ensure_ascii=False, indent=1) for r in corpusLookup(args.corpus, args.key))
+
+
+def sqliteStore(args):
+    from sqliteStore import buildSQLiteStore
+    return buildSQLiteStore(args.out)
+
+
+def search(args):
+    from sqliteStore import searchATUs, searchCitations
+    found:list[dict] = (searchATUs if args.what == "atu" else searchCitations)(args.text, args.limit, args.store)
+    return "\n".join("{}\t{}".format(r.get('atu') or r.get('key') or r.get('id'), r.get('snippet') or r.get('text'))
+                     for r in found)
+
+
+def bench(args):
+    from benchmarks import benchmarkMain
+    bench_args:list[str] = args.bench_args
+    return benchmarkMain(bench_args[1:] if bench_args[:1] == ["--"] else bench_args)
+
+
+def pipeline(args):
+    from pipeline import runPipeline
+    return runPipeline(args.targets, args.workers, args.force, args.dry_run, args.touch)
+
+
+def schema(args):
+    from neo4jUtils import createSchema, dropSchema
+    return dropSchema() if args.drop else createSchema()
+
+
+def loadNodes(args):
+    from neo4jUtils import streamNodeSet
+    return streamNodeSet(args.label, args.batch_size, args.workers, not args.restart)
+
+
+def linkRelations(args):
+    from neo4jUtils import createRelBatches
+    return createRelBatches(args.source, args.relation, args.batch_size)
+
+
+def createClasses(args):
+    from parsing import createATUClasses
+    return createATUClasses()
+
+
+def classifyATUs(args):
+    if args.concurrency > 1:
+        from parsing import attachATUs2Classes
+        from asyncIngest import classifyATUs
+        return classifyATUs(attachATUs2Classes(), args.concurrency)
+    from parsing import classifyAllATUs
+    return classifyAllATUs()
+
+
+def retireATUs(args):
+    from neo4jUtils import classifyRetiredATUs, linkRetiredATUs
+    return {'classified': classifyRetiredATUs(), 'merged': linkRetiredATUs()}
+
+
+def linkMotifs(args):
+    from neo4jUtils import linkMotifs
+    return linkMotifs()
+
+
+def traditions(args):
+    from parsing import createTraditions
+    return createTraditions()
+
+
+def subjects(args):
+    from parsing import createNeo4jSubjects
+    return createNeo4jSubjects(args.concurrency)
+
+
+def remarks(args):
+    from parsing import extractRemarks
+    return extractRemarks()
+
+
+def combos(args):
+    from parsing import extractCombos
+    return extractCombos()
+
+
+def subjectLinks(args):
+    from parsing import extractSubjectCfs
+    return extractSubjectCfs()
+
+
+def citations(args):
+    from parsing import attachATUs2Citations, runCitationWorkers
+    if args.workers > 1:
+        return runCitationWorkers(args.workers, not args.restart, args.batch_size)
+    return attachATUs2Citations(resume=not args.restart, batch_size=args.batch_size)
+
+
+# name: (handler, help, touches the graph, arguments)
+commands:dict = {
+    'parse-atus': (parseATUs, "parse the ATU PDFs into atus_<date>.json", False, []),
+    'parse-traditions': (parseTraditions, "parse the tradition appendix into data/traditions_parsed.json", False, []),
+    'parse-sources': (parseSources, "parse the reference appendix into data/citations_parsed.json", False, []),
+    'parse-subjects': (parseSubjects, "parse the subject index into data/subjects2.tsv", False,
+                       [(["--json"], {'action': "store_true",
+                                      'help': "turn the reviewed data/subjects.tsv into data/subjects_parsed.json instead"})]),
+    'tmi-refs': (tmiRefs, "parse the TMI bibliography into data/tmi_refs_parsed.json", False, []),
+    'tmi-traditions': (tmiTraditions, "collect TMI reference elements into data/tmi_trads.json", False, []),
+    'export-bulk': (exportBulk, "write CSVs for neo4j-admin database import", False,
+                    [(["--out"], {'default': "import"})]),
+    'lookup': (lookup, "print the records of a data/*.json corpus stored under a key, from its compiled cache", False,
+               [(["corpus"], {'choices': ["atu", "citations", "subjects", "tmi_refs", "traditions"]}),
+                (["key"], {'help': "an ATU number, a reference, a subject..."})]),
+    'sqlite-store': (sqliteStore, "load every graph stage into an embedded SQLite file for offline reads", False,
+                     [(["--out"], {'default': "data/tomes.sqlite"})]),
+    'search': (search, "full-text search of ATUs or citations in the SQLite store", False,
+               [(["what"], {'choices': ["atu", "citation"]}),
+                (["text"], {'help': "an FTS5 query, e.g. 'stepmother AND shoe'"}),
+                (["--limit"], {'type': int, 'default': 20}),
+                (["--store"], {'default': "data/tomes.sqlite"})]),
+    'bench': (bench, "benchmark the parsing stages (options after -- go to the benchmark)", False,
+              [(["bench_args"], {'nargs': REMAINDER})]),
+    'pipeline': (pipeline, "bring stages (default: all) up to date, skipping unchanged ones", True,
+                 [(["targets"], {'nargs': "*", 'help': "stages to build, with everything upstream"}),
+                  (["--workers"], {'type': int, 'default': None, 'help': "processes for file stages"}),
+                  (["--force"], {'action': "append", 'metavar': "STAGE", 'help': "rerun STAGE even if up to date"}),
+                  (["--dry-run"], {'action': "store_true", 'help': "only report what would run"}),
+                  (["--touch"], {'action': "store_true", 'help': "record the current state as built, running nothing"})]),
+    'schema': (schema, "create (or --drop) the constraints and indexes", True,
+               [(["--drop"], {'action': "store_true"})]),
+    'load-nodes': (loadNodes, "stream a label's source file into nodes", True,
+                   [(["label"], {'choices': ["atu", "motif", "ref"]}),
+                    (["--batch-size"], {'type': int, 'default': 1000}),
+                    (["--workers"], {'type': int, 'default': 1}),
+                    (["--restart"], {'action': "store_true", 'help': "ignore the journal of committed batches"})]),
+    'link-relations': (linkRelations, "create the relationships listed in a label's source file", True,
+                       [(["source"], {'choices': ["atu"]}),
+                        (["relation"], {'choices': ["motifs"]}),
+                        (["--batch-size"], {'type': int, 'default': 500})]),
+    'create-classes': (createClasses, "create the ATU class tree from data/ATU_outline.txt and file the ATUs in it", True, []),
+    'classify-atus': (classifyATUs, "file ATUs under their leaf classes of an existing class tree", True,
+                      [(["--concurrency"], {'type': int, 'default': 1})]),
+    'retire-atus': (retireATUs, "classify discontinued ATUs and link them to their successors", True, []),
+    'link-motifs': (linkMotifs, "link motifs to their parent motifs", True, []),
+    'traditions': (traditions, "create the tradition classes and traditions", True, []),
+    'subjects': (subjects, "create the subjects and link them to ATUs", True,
+                 [(["--concurrency"], {'type': int, 'default': 8})]),
+    'remarks': (remarks, "set ATU remarks", True, []),
+    'combos': (combos, "link ATUs that are combined with each other", True, []),
+    'subject-links': (subjectLinks, "create the see-also links between subjects", True, []),
+    'citations': (citations, "create the citations of every ATU", True,
+                  [(["--workers"], {'type': int, 'default': 1}),
+                   (["--batch-size"], {'type': int, 'default': 25}),
+                   (["--restart"], {'action': "store_true", 'help': "ignore the journal of committed ATUs"})]),
+                }
+
+
+def buildParser()->ArgumentParser:
+    parser = ArgumentParser(prog="cli.py", description="Run a stage of the TOMES ATU pipeline.")
+    parser.add_argument("--backend", choices=["neo4j", "memory", "sqlite"], default="neo4j",
+                        help="graph to use; memory runs against an in-process graph, sqlite reads the built store")
+    parser.add_argument("--profile", type=int, metavar="PLANS", default=None,
+                        help="profile graph statements, capturing PLANS PROFILE plans per statement")
+    parser.add_argument("--log-level", default=None, help="console log level (default: loguru's own DEBUG console)")
+    sub = parser.add_subparsers(dest="command", required=True, metavar="command")
+    for name, (handler, help_text, _, arguments) in commands.items():
+        p = sub.add_parser(name, help=help_text)
+        for flags, options in arguments:
+            p.add_argument(*flags, **options)
+        p.set_defaults(handler=handler)
+    return parser
+
+
+def main(argv:list[str]=None)->int:
+    args = buildParser().parse_args(argv)
+    if args.log_level is not None:
+        from log import configureLogging
+        configureLogging(console_level=args.log_level.upper())
+    graph:bool = commands[args.command][2]
+    if graph:
+        from neo4jUtils import useBackend, profileQueries
+        useBackend(args.backend)
+        if args.profile is not None:
+            profileQueries(plans=args.profile)
+    result = args.handler(args)
+    if graph and args.profile is not None:
+        from neo4jUtils import profileReport
+        profileReport()
+    if args.command == "bench":
+        return result
+    if result is not None:
+        print(result)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,210 @@
+from hashlib import sha256
+from json import dumps, loads
+from mmap import mmap, ACCESS_READ
+from os import makedirs, path, replace, stat
+from struct import Struct
+from threading import Lock
+
+
+# Compiled, memory-mapped copies of the data/*.json corpora. Each cache file is
+#   header | record offsets | sorted key table | key bytes | record bytes
+# where every record is stored as compact JSON. Records are read by position or
+# found by binary search on the key table straight from the mapping, so a lookup
+# decodes one record instead of the whole corpus. The header carries the size,
+# mtime and SHA-256 of the JSON it was built from; a cache whose source changed
+# is rebuilt on the next open.
+corpora:dict = {
+    'atu': {'file': "data/atu.json", 'key': "atu"},
+    'citations': {'file': "data/citations.json", 'key': "ref"},
+    'subjects': {'file': "data/subjects.json"},
+    'tmi_refs': {'file': "data/tmi_refs.json"},
+    'traditions': {'file': "data/traditions.json", 'key': "continent"},
+                }
+
+cache_dir:str = "data/.corpus_cache"
+magic:bytes = b"TOMC"
+version:int = 1
+header = Struct("<4sHBxQQ32sI")   # magic, version, keyed by map, source size, mtime, digest, records
+offset = Struct("<Q")
+key_entry = Struct("<QII")         # key offset, key length, record index
+open_corpora:dict = {}
+corpus_lock = Lock()
+
+
+def sourceDigest(file_name:str)->bytes:
+    h = sha256()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.digest()
+
+
+def corpusName(file_name:str)->str:
+    """The corpus compiled from file_name, or None if it is not one."""
+    for name, corpus in corpora.items():
+        if path.normpath(corpus['file']) == path.normpath(file_name):
+            return name
+    return None
+
+
+def cachePath(name:str)->str:
+    return path.join(cache_dir, "{}.bin".format(name))
+
+
+def buildCorpusCache(name:str)->str:
+    """Compile a corpus into its cache file, atomically."""
+    from json import load
+    corpus:dict = corpora[name]
+    st = stat(corpus['file'])
+    with open(corpus['file'], "r", encoding='utf-8') as f:
+        data = load(f)
+    mapped:bool = isinstance(data, dict)
+    if mapped:
+        keys:list[str] = list(data)
+        records:list = list(data.values())
+    else:
+        records = data
+        keys = [str(r.get(corpus['key'], "")) for r in records]
+    blobs:list[bytes] = [dumps(r, ensure_ascii=False, separators=(",", ":")).encode() for r in records]
+    key_blobs:list[bytes] = [k.encode() for k in keys]
+    n:int = len(records)
+    table_start:int = header.size + offset.size * (n + 1)
+    keys_start:int = table_start + key_entry.size * n
+    records_start:int = keys_start + sum(len(k) for k in key_blobs)
+    key_offsets:list[int] = []
+    at:int = keys_start
+    for k in key_blobs:
+        key_offsets.append(at)
+        at += len(k)
+    order:list[int] = sorted(range(n), key=lambda i: (key_blobs[i], i))
+    makedirs(cache_dir, exist_ok=True)
+    file_name:str = cachePath(name)
+    with open(file_name + ".tmp", 'wb') as f:
+        f.write(header.pack(magic, version, mapped, st.st_size, st.st_mtime_ns,
+                            sourceDigest(corpus['file']), n))
+        at = records_start
+        for b in blobs:
+            f.write(offset.pack(at))
+            at += len(b)
+        f.write(offset.pack(at))
+        for i in order:
+            f.write(key_entry.pack(key_offsets[i], len(key_blobs[i]), i))
+        for k in key_blobs:
+            f.write(k)
+        for b in blobs:
+            f.write(b)
+    replace(file_name + ".tmp", file_name)
+    return file_name
+
+
+def readHeader(mm)->dict:
+    m, v, mapped, size, mtime_ns, digest, n = header.unpack_from(mm, 0)
+    return {'magic': m, 'version': v, 'mapped': bool(mapped), 'size': size,
+            'mtime_ns': mtime_ns, 'digest': digest, 'records': n}
+
+
+def mapCache(name:str)->dict:
+    with open(cachePath(name), 'rb') as f:
+        mm = mmap(f.fileno(), 0, access=ACCESS_READ)
+    return {'mm': mm, 'header': readHeader(mm)}
+
+
+def isCurrent(handle:dict, name:str)->bool:
+    """Whether a cache still matches its JSON: by size and mtime, or failing
+    that by content, so a touched but unchanged file is not recompiled."""
+    h:dict = handle['header']
+    if h['magic'] != magic or h['version'] != version:
+        return False
+    st = stat(corpora[name]['file'])
+    if (h['size'], h['mtime_ns']) == (st.st_size, st.st_mtime_ns):
+        return True
+    return h['size'] == st.st_size and h['digest'] == sourceDigest(corpora[name]['file'])
+
+
+def statKey(name:str)->tuple:
+    st = stat(corpora[name]['file'])
+    return st.st_size, st.st_mtime_ns
+
+
+def openCorpus(name:str)->dict:
+    """The mapped cache of a corpus, compiled first if missing or stale. The
+    mapping is kept for the process and checked against the JSON on each call."""
+    with corpus_lock:
+        handle:dict = open_corpora.get(name)
+        if handle is not None and handle['stat'] == statKey(name):
+            return handle
+        if handle is not None:
+            handle['mm'].close()
+        handle = mapCache(name) if path.exists(cachePath(name)) else None
+        if handle is None or not isCurrent(handle, name):
+            if handle is not None:
+                handle['mm'].close()
+            buildCorpusCache(name)
+            handle = mapCache(name)
+        handle['stat'] = statKey(name)
+        open_corpora[name] = handle
+        return handle
+
+
+def corpusLen(name:str)->int:
+    return openCorpus(name)['header']['records']
+
+
+def recordBytes(handle:dict, i:int)->bytes:
+    start, end = (offset.unpack_from(handle['mm'], header.size + offset.size * j)[0] for j in (i, i + 1))
+    return handle['mm'][start:end]
+
+
+def keyAt(handle:dict, j:int)->tuple:
+    """The key bytes and record index of the j-th entry of the sorted key table."""
+    n:int = handle['header']['records']
+    k_off, k_len, i = key_entry.unpack_from(handle['mm'], header.size + offset.size * (n + 1) + key_entry.size * j)
+    return handle['mm'][k_off:k_off + k_len], i
+
+
+def corpusRecord(name:str, i:int):
+    """The i-th record of a corpus, in the JSON's own order."""
+    handle:dict = openCorpus(name)
+    if not 0 <= i < handle['header']['records']:
+        raise IndexError(i)
+    return loads(recordBytes(handle, i))
+
+
+def corpusLookup(name:str, key:str)->list:
+    """Every record stored under key (an ATU number, a ref, a subject...), in
+    file order, found by binary search without decoding any other record."""
+    handle:dict = openCorpus(name)
+    target:bytes = key.encode()
+    lo:int = 0
+    hi:int = handle['header']['records']
+    while lo < hi:
+        mid:int = (lo + hi) // 2
+        if keyAt(handle, mid)[0] < target:
+            lo = mid + 1
+        else:
+            hi = mid
+    found:list = []
+    while lo < handle['header']['records']:
+        k, i = keyAt(handle, lo)
+        if k != target:
+            break
+        found.append(loads(recordBytes(handle, i)))
+        lo += 1
+    return found
+
+
+def iterCorpus(name:str):
+    """Decode the records one at a time, in file order; keyed corpora yield
+    (key, record) pairs like dict.items()."""
+    handle:dict = openCorpus(name)
+    n:int = handle['header']['records']
+    if not handle['header']['mapped']:
+        for i in range(n):
+            yield loads(recordBytes(handle, i))
+        return
+    keys:dict = {}
+    for j in range(n):
+        k, i = keyAt(handle, j)
+        keys[i] = k.decode()
+    for i in range(n):
+        yield keys[i], loads(recordBytes(handle, i))
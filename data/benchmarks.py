@@ -0,0 +1,201 @@
+from json import dump, load
+from atuStore import atuRecords
+from os import makedirs, path
+from time import perf_counter
+from datetime import datetime as time
+from types import SimpleNamespace
+from argparse import ArgumentParser
+import platform
+import tracemalloc
+import pdfPages
+import parsing
+
+
+# Each stage is (setup, run): setup prepares inputs outside the timed region and
+# run(inputs) does the work and returns the number of items it processed.
+
+
+def extractionStage(volume:dict):
+    """Cold page extraction: the page cache is bypassed while timing."""
+    def run(_):
+        cache_dir = pdfPages.cache_dir
+        pdfPages.cache_dir = None
+        try:
+            return len(pdfPages.extractPages(volume['file'], volume['start'], volume['end']))
+        finally:
+            pdfPages.cache_dir = cache_dir
+    return (lambda: None), run
+
+
+def segmentationStage(volume:dict):
+    """segmentAtus over the chunks of the benchmark pages."""
+    def setup():
+        chunks:list[str] = []
+        for raw in pdfPages.extractPages(volume['file'], volume['start'], volume['end']):
+            chunks.extend(parsing.atuText2list(raw))
+        leads:list[float] = [parsing.clean_2_float(parsing.chunkLead(c)) for c in chunks[1:]]
+        start_fl:float = next((int(fl) for fl in leads if fl >= 0), parsing.last_known_atu_fl)
+        return chunks, start_fl
+
+    def run(inputs):
+        chunks, start_fl = inputs
+        parsing.clean_2_float.cache_clear()
+        parsing.segmentAtus(chunks, start_fl=start_fl)
+        return len(chunks)
+    return setup, run
+
+
+def rubricStage():
+    """processRubric over rubric text rebuilt from every ATU in atu.json."""
+    def setup():
+        rubrics:list[tuple] = []
+        for a in atuRecords():
+            if a.get('remarks'):
+                rubrics.append(("Remarks", "Remarks: " + a['remarks']))
+            if a.get('combos'):
+                rubrics.append(("Combinations", "Combinations: This type is usually combined with " + ", ".join(a['combos']) + "."))
+            if a.get('literature'):
+                lit:str = "; ".join("{}: {}".format(k, v) for k, v in a['literature'].items() if k != 'cf')
+                rubrics.append(("Literature/Variants", "Literature/Variants: " + lit))
+        return rubrics
+
+    def run(rubrics):
+        for rubric, content in rubrics:
+            parsing.processRubric(rubric, content, {})
+        return len(rubrics)
+    return setup, run
+
+
+def citationStage():
+    """cleanRefs over every literature entry in atu.json, memo cleared."""
+    def setup():
+        return [e for a in atuRecords() for r in a.get('literature', {}).values() for e in (r if isinstance(r, tuple) else [r])]
+
+    def run(entries):
+        quiet = SimpleNamespace(info=lambda *args: None)
+        parsing.recognizeCitation.cache_clear()
+        for e in entries:
+            parsing.cleanRefs(e, quiet)
+        return len(entries)
+    return setup, run
+
+
+def subjectStage():
+    """readSubjectsTSV over the reviewed subject index."""
+    return (lambda: None), (lambda _: len(parsing.readSubjectsTSV()))
+
+
+def referenceStage():
+    """readTMIrefs over the TMI bibliography."""
+    return (lambda: None), (lambda _: len(parsing.readTMIrefs()))
+
+
+def motifReferenceStage():
+    """readMotifReferenceElements over tmi.json."""
+    return (lambda: None), (lambda _: len(parsing.readMotifReferenceElements()))
+
+
+def benchmarkStages(pages:int=20)->dict:
+    """The stages to run, with the PDF ones limited to the first pages of ATU2."""
+    volume:dict = {'file': "data/ATU2.pdf", 'start': 9, 'end': 9 + pages}
+    stages:dict = {'citation_cleaning': citationStage(),
+                   'rubric_parsing': rubricStage(),
+                   'subject_parsing': subjectStage(),
+                   'reference_parsing': referenceStage()}
+    if path.exists(volume['file']):
+        stages['page_extraction'] = extractionStage(volume)
+        stages['segmentation'] = segmentationStage(volume)
+    if path.exists('data/tmi.json'):
+        stages['motif_references'] = motifReferenceStage()
+    return stages
+
+
+def measure(setup, run, repeat:int)->dict:
+    """Best-of-repeat wall time, then one traced run for peak memory."""
+    inputs = setup()
+    timings:list[float] = []
+    for _ in range(repeat):
+        start = perf_counter()
+        items:int = run(inputs)
+        timings.append(perf_counter() - start)
+    tracemalloc.start()
+    run(inputs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    seconds:float = min(timings)
+    return {'seconds': seconds, 'peak_kib': peak / 1024, 'items': items,
+            'items_per_second': items / seconds if seconds else 0.0}
+
+
+def runBenchmarks(repeat:int=3, pages:int=20, only:list[str]=None)->dict:
+    """Time every stage on the real data/ files."""
+    stages:dict = benchmarkStages(pages)
+    results:dict = {'meta': {'when': time.now().isoformat(timespec="seconds"),
+                             'python': platform.python_version(),
+                             'pypdf': pdfPages.pypdfVersion(),
+                             'machine': platform.machine(),
+                             'repeat': repeat, 'pages': pages},
+                    'stages': {}}
+    for name, (setup, run) in stages.items():
+        if only and name not in only:
+            continue
+        results['stages'][name] = measure(setup, run, repeat)
+        print("{:<20} {:>9.4f}s {:>11.0f} KiB {:>12.0f} items/s".format(
+            name, results['stages'][name]['seconds'], results['stages'][name]['peak_kib'],
+            results['stages'][name]['items_per_second']))
+    return results
+
+
+def compareBaseline(results:dict, baseline:dict, tolerance:float=0.10)->dict:
+    """Ratio of each stage's time and peak memory to the baseline; a stage has
+    regressed when either grows by more than tolerance."""
+    comparison:dict = {}
+    for name, r in results['stages'].items():
+        b:dict = baseline['stages'].get(name)
+        if b is None:
+            continue
+        time_ratio:float = r['seconds'] / b['seconds'] if b['seconds'] else float("inf")
+        memory_ratio:float = r['peak_kib'] / b['peak_kib'] if b['peak_kib'] else float("inf")
+        comparison[name] = {'time_ratio': time_ratio, 'memory_ratio': memory_ratio,
+                            'regressed': time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance}
+    return comparison
+
+
+def saveResults(results:dict, file_name:str)->str:
+    """Write results as JSON."""
+    makedirs(path.dirname(file_name) or ".", exist_ok=True)
+    with open(file_name, 'w', encoding="utf-8") as f:
+        dump(results, f, indent=1, ensure_ascii=False)
+    return file_name
+
+
+def benchmarkMain(argv:list[str]=None)->int:
+    """Run the suite, save the results and compare them with the baseline.
+    The first run without a baseline records one. Returns 1 if any stage regressed."""
+    parser = ArgumentParser(description="Benchmark the parsing pipeline on the bundled data.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=20, help="ATU2.pdf pages for the PDF stages")
+    parser.add_argument("--stage", action="append", help="only run this stage (repeatable)")
+    parser.add_argument("--out", default="bench/results.json")
+    parser.add_argument("--baseline", default="bench/baseline.json")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args(argv)
+    results:dict = runBenchmarks(args.repeat, args.pages, args.stage)
+    saveResults(results, args.out)
+    if args.save_baseline or not path.exists(args.baseline):
+        if not args.save_baseline:
+            print("No baseline at {}; this run was recorded as the baseline, nothing was compared.".format(args.baseline))
+        saveResults(results, args.baseline)
+        return 0
+    with open(args.baseline, "r", encoding='utf-8') as f:
+        baseline:dict = load(f)
+    comparison:dict = compareBaseline(results, baseline, args.tolerance)
+    for name, c in comparison.items():
+        print("{:<20} time x{:.2f}  memory x{:.2f}{}".format(
+            name, c['time_ratio'], c['memory_ratio'], "  REGRESSED" if c['regressed'] else ""))
+    return 1 if any(c['regressed'] for c in comparison.values()) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(benchmarkMain())
@@ -0,0 +1,119 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from hashlib import sha256
+from os import cpu_count, makedirs, path, replace, stat
+
+
+# Extracted page text is cached here, keyed by PDF content hash, extraction mode,
+# pypdf version and page number. Set to None to always extract.
+cache_dir:str = "data/.page_cache"
+pdf_hashes:dict = {}
+
+
+def extractPageRange(file_name:str, start:int, end:int, mode:str="layout")->list[str]:
+    """Extract the text of pages start..end-1 with a reader of its own, so that
+    it can run in a worker process."""
+    from pypdf import PdfReader
+    reader = PdfReader(file_name)
+    texts:list[str] = [reader.pages[p].extract_text(extraction_mode=mode) for p in range(start, end)]
+    reader.close()
+    return texts
+
+
+def pageRanges(start:int, end:int, parts:int)->list[tuple]:
+    """Split start..end into at most parts contiguous ranges of near-equal size."""
+    n:int = end - start
+    parts = max(1, min(parts, n))
+    return [(start + n * i // parts, start + n * (i + 1) // parts) for i in range(parts)]
+
+
+def pypdfVersion()->str:
+    """pypdf is only imported once pages are actually read or cached."""
+    from pypdf import __version__
+    return __version__
+
+
+def pdfHash(file_name:str)->str:
+    """SHA-256 of a PDF's content, computed once per file version per process."""
+    st = stat(file_name)
+    k:tuple = (path.abspath(file_name), st.st_mtime_ns, st.st_size)
+    if k not in pdf_hashes:
+        h = sha256()
+        with open(file_name, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        pdf_hashes[k] = h.hexdigest()
+    return pdf_hashes[k]
+
+
+def cachedPagePath(digest:str, p:int, mode:str)->str:
+    """Where the text of page p of the PDF with this digest lives in the cache."""
+    return path.join(cache_dir, digest, "{}-pypdf{}".format(mode, pypdfVersion()), "{}.txt".format(p))
+
+
+def readCachedPage(digest:str, p:int, mode:str)->str:
+    """Return the cached text of a page, or None if it has not been extracted."""
+    file_name:str = cachedPagePath(digest, p, mode)
+    if not path.exists(file_name):
+        return None
+    with open(file_name, 'r', encoding="utf-8", errors="surrogatepass", newline="") as f:
+        return f.read()
+
+
+def writeCachedPage(digest:str, p:int, mode:str, text:str):
+    """Store the text of a page, atomically so that readers never see half a page."""
+    file_name:str = cachedPagePath(digest, p, mode)
+    makedirs(path.dirname(file_name), exist_ok=True)
+    with open(file_name + ".tmp", 'w', encoding="utf-8", errors="surrogatepass", newline="") as f:
+        f.write(text)
+    replace(file_name + ".tmp", file_name)
+
+
+def missingRuns(pages:list[int])->list[tuple]:
+    """Group sorted page numbers into contiguous (start, end) runs."""
+    runs:list[tuple] = []
+    for p in pages:
+        if runs and runs[-1][1] == p:
+            runs[-1] = (runs[-1][0], p + 1)
+        else:
+            runs.append((p, p + 1))
+    return runs
+
+
+def extractPages(file_name:str, start:int, end:int, mode:str="layout",
+                 processes:int=None, progress=None)->list[str]:
+    """Extract the text of pages start..end-1 in page order. Pages already in
+    the cache are read from disk; the rest are spread over a process pool (all
+    cores by default) in contiguous ranges and then cached. Every page is
+    extracted exactly as the serial path would, so the output is identical.
+    progress, if given, is called with the number of pages finished."""
+    texts:dict = {}
+    digest:str = pdfHash(file_name) if cache_dir is not None else None
+    if digest is not None:
+        for p in range(start, end):
+            cached:str = readCachedPage(digest, p, mode)
+            if cached is not None:
+                texts[p] = cached
+        if texts and progress is not None:
+            progress(len(texts))
+    runs:list[tuple] = missingRuns([p for p in range(start, end) if p not in texts])
+    processes = processes or cpu_count() or 1
+    if processes == 1 or sum(e - s for s, e in runs) < 2:
+        for s, e in runs:
+            for p in range(s, e):
+                texts[p] = extractPageRange(file_name, p, p + 1, mode)[0]
+                if digest is not None:
+                    writeCachedPage(digest, p, mode, texts[p])
+                if progress is not None:
+                    progress(1)
+    else:
+        ranges:list[tuple] = [r for s, e in runs for r in pageRanges(s, e, processes * 4)]
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures:dict = {pool.submit(extractPageRange, file_name, s, e, mode): s for s, e in ranges}
+            for fut in as_completed(futures):
+                for p, text in enumerate(fut.result(), start=futures[fut]):
+                    texts[p] = text
+                    if digest is not None:
+                        writeCachedPage(digest, p, mode, text)
+                if progress is not None:
+                    progress(len(fut.result()))
+    return [texts[p] for p in range(start, end)]
@@ -1,7 +1,8 @@
-from io import StringIO, BytesIO
-from pandas import DataFrame, read_csv
+from io import BytesIO
+from pandas import DataFrame
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse, urlunparse
+from catalogStore import catalog_settings, loadCatalog
 import streamlit as st
 import requests
 import zipfile
@@ -10,12 +11,10 @@ import zipfile
 locc:str = None
 
 
-@st.cache_data
+@st.cache_data(ttl=catalog_settings['max_age'])
 def getCatalog()->DataFrame:
     """ """
-    raw = requests.get("https://www.gutenberg.org/cache/epub/feeds/pg_catalog.csv.gz")
-    catalog_text:str = raw.content.decode("utf-8")
-    return DataFrame(read_csv(StringIO(catalog_text)))
+    return loadCatalog()
 
 
 @st.cache_data
@@ -37,7 +36,7 @@ def getText(id:int)->list[str]:
 with st.sidebar:
     catalog_df:DataFrame = getCatalog()
     if not catalog_df.empty:
-        locc = st.selectbox("Please select a Library of Congress Subject Heading", catalog_df['LoCC'].unique())
+        locc = st.selectbox("Please select a Library of Congress Subject Heading", catalog_df['LoCC'].dropna().unique())
 
 
 if locc:
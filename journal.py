@@ -0,0 +1,31 @@
+from os import makedirs, path, remove
+
+
+def journalPath(name:str)->str:
+    """Locate the journal file for a named job."""
+    return "logs/{}.journal".format(name)
+
+
+def readJournal(name:str)->set[str]:
+    """Return every entry recorded as committed for a job."""
+    file_name:str = journalPath(name)
+    if not path.exists(file_name):
+        return set()
+    with open(file_name, 'r', encoding="utf-8") as f:
+        return set(l.strip() for l in f if l.strip() != "")
+
+
+def appendJournal(name:str, entry:str):
+    """Record one committed entry. Each entry is a single short append, so 
+    concurrent writers (threads or processes) do not interleave."""
+    file_name:str = journalPath(name)
+    makedirs(path.dirname(file_name), exist_ok=True)
+    with open(file_name, 'a', encoding="utf-8") as f:
+        f.write("{}\n".format(entry))
+
+
+def clearJournal(name:str):
+    """Forget all progress for a job so that the next run starts over."""
+    file_name:str = journalPath(name)
+    if path.exists(file_name):
+        remove(file_name)
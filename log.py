@@ -1,7 +1,53 @@
-from loguru import logger
+from multiprocessing import parent_process
+from os import getpid
+import sys
+
+
+# The file sink is enqueued: records go through a multiprocessing-safe queue to a
+# background writer thread, so logging calls do not wait on the disk. Processes
+# forked from the one that configured logging inherit its sinks and write
+# through the same queue; spawned workers get a log file of their own, so two
+# processes never rotate the same file. loguru itself is only imported once
+# something asks for the logger. The console is left to loguru's own stderr
+# sink unless a console_level is asked for, which replaces that sink.
+log_settings:dict = {'file': "logs/current.log",
+                     'rotation': "5 minutes",
+                     'retention': 10,
+                     'file_level': "SUCCESS",
+                     'console_level': None}
+log_state:dict = {'configured': False, 'sinks': [], 'console_replaced': False}
+
+
+def configureLogging(**settings):
+    """(Re)configure the sinks. Settings are the keys of log_settings."""
+    unknown = set(settings) - set(log_settings)
+    if unknown:
+        raise KeyError("Unknown log setting(s): {}".format(unknown))
+    from loguru import logger
+    log_settings.update(settings)
+    file_name:str = log_settings['file']
+    if parent_process() is not None:
+        file_name = file_name.replace(".log", "-{}.log".format(getpid()))
+    for sink in log_state['sinks']:
+        logger.remove(sink)
+    log_state['sinks'] = []
+    if log_settings['console_level'] is not None:
+        if not log_state['console_replaced']:
+            logger.remove(0)    # loguru's own stderr handler
+            log_state['console_replaced'] = True
+        log_state['sinks'].append(logger.add(sys.stderr, level=log_settings['console_level']))
+    elif log_state['console_replaced']:
+        # Going back to loguru's console: stderr at its default level.
+        log_state['sinks'].append(logger.add(sys.stderr))
+    log_state['sinks'].append(logger.add(file_name, rotation=log_settings['rotation'], retention=log_settings['retention'],
+                                         level=log_settings['file_level'], enqueue=True))
+    log_state['configured'] = True
+    return logger
 
 
 def f_logger():
-    """ """
-    logger.add("logs/current.log", rotation="5 minutes", retention=10, level="SUCCESS")
+    """Return the shared logger, adding its sinks on first use in a process."""
+    if not log_state['configured']:
+        return configureLogging()
+    from loguru import logger
     return logger
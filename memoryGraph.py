@@ -0,0 +1,395 @@
+from collections import defaultdict
+from itertools import count
+from types import SimpleNamespace
+
+
+# An in-process stand-in for the Neo4j database. Nodes and relationships live
+# in dicts keyed by integer ids; every scalar node property is indexed per label
+# so that keyed matches are dictionary lookups, and each node keeps adjacency
+# lists of its outgoing and incoming relationships.
+memory_graph:dict = {}
+
+counter_names:list[str] = ["nodes_created", "nodes_deleted", "relationships_created",
+                           "relationships_deleted", "properties_set", "labels_added",
+                           "labels_removed", "indexes_added", "indexes_removed",
+                           "constraints_added", "constraints_removed"]
+
+
+def resetMemoryGraph()->dict:
+    """Empty the in-memory graph."""
+    memory_graph.clear()
+    memory_graph.update({'nodes': {}, 'rels': {},
+                         'out': defaultdict(list), 'in': defaultdict(list),
+                         'labels': defaultdict(dict), 'index': defaultdict(dict),
+                         'ids': count(), 'journals': set()})
+    return memory_graph
+
+
+resetMemoryGraph()
+
+
+def memoryCounters()->SimpleNamespace:
+    """Zeroed counters with the attribute names of neo4j's SummaryCounters."""
+    return SimpleNamespace(**{c: 0 for c in counter_names})
+
+
+def indexable(value)->bool:
+    return isinstance(value, (str, int, float, bool))
+
+
+def indexNode(n:int, props:dict, add:bool=True):
+    """Add or remove a node's properties in the per-label index."""
+    node:dict = memory_graph['nodes'][n]
+    for label in node['labels']:
+        for k, v in props.items():
+            if not indexable(v):
+                continue
+            entries:dict = memory_graph['index'][(label, k)].setdefault(v, {})
+            if add:
+                entries[n] = None
+            else:
+                entries.pop(n, None)
+
+
+def createNode(labels:list[str], props:dict, counters:SimpleNamespace)->int:
+    """CREATE (n:labels) SET n = props"""
+    n:int = next(memory_graph['ids'])
+    props = {k: v for k, v in props.items() if v is not None}
+    memory_graph['nodes'][n] = {'labels': list(labels), 'props': props}
+    for label in labels:
+        memory_graph['labels'][label][n] = None
+    indexNode(n, props)
+    counters.nodes_created += 1
+    counters.labels_added += len(labels)
+    counters.properties_set += len(props)
+    return n
+
+
+def setProperty(n:int, key:str, value, counters:SimpleNamespace):
+    """SET n.key = value"""
+    props:dict = memory_graph['nodes'][n]['props']
+    if key in props:
+        indexNode(n, {key: props[key]}, add=False)
+    props[key] = value
+    indexNode(n, {key: value})
+    counters.properties_set += 1
+
+
+def deleteNode(n:int, counters:SimpleNamespace):
+    """DETACH DELETE n"""
+    for r in memory_graph['out'].pop(n, []) + memory_graph['in'].pop(n, []):
+        rel:dict = memory_graph['rels'].pop(r, None)
+        if rel is None:
+            continue
+        other:int = rel['end'] if rel['start'] == n else rel['start']
+        for side in ('out', 'in'):
+            if r in memory_graph[side].get(other, []):
+                memory_graph[side][other].remove(r)
+        counters.relationships_deleted += 1
+    indexNode(n, memory_graph['nodes'][n]['props'], add=False)
+    for label in memory_graph['nodes'][n]['labels']:
+        memory_graph['labels'][label].pop(n, None)
+    del memory_graph['nodes'][n]
+    counters.nodes_deleted += 1
+
+
+def createRel(start:int, rel_type:str, end:int, props:dict, counters:SimpleNamespace)->int:
+    """CREATE (start)-[:rel_type props]->(end)"""
+    r:int = next(memory_graph['ids'])
+    memory_graph['rels'][r] = {'type': rel_type, 'start': start, 'end': end, 'props': dict(props)}
+    memory_graph['out'][start].append(r)
+    memory_graph['in'][end].append(r)
+    counters.relationships_created += 1
+    counters.properties_set += len(props)
+    return r
+
+
+def mergeUndirected(start:int, rel_type:str, end:int, props:dict, counters:SimpleNamespace):
+    """MERGE (start)-[:rel_type props]-(end)"""
+    for r in memory_graph['out'][start] + memory_graph['in'][start]:
+        rel:dict = memory_graph['rels'][r]
+        if (rel['type'] == rel_type and {rel['start'], rel['end']} == {start, end}
+            and all(rel['props'].get(k) == v for k, v in props.items())):
+            return
+    createRel(start, rel_type, end, props, counters)
+
+
+def matchNodes(label:str, key:str=None, value=None)->list[int]:
+    """MATCH (n:label { key: value }), or every node of a label without a key."""
+    if key is None:
+        return list(memory_graph['labels'][label])
+    if not indexable(value):
+        return []
+    return list(memory_graph['index'][(label, key)].get(value, {}))
+
+
+def prop(n:int, key:str):
+    return memory_graph['nodes'][n]['props'].get(key)
+
+
+def hasLabel(n:int, label:str)->bool:
+    return label in memory_graph['nodes'][n]['labels']
+
+
+glosses:dict = {
+    'superclass': {'relationGloss': "subclass of", 'inverseGloss': "superclass of"},
+    'class': {'relationGloss': "member of", 'inverseGloss': "includes"},
+    'discontinued': {'relationGloss': "merged into", 'inverseGloss': "absorbed"},
+    'parent': {'relationGloss': "variant of", 'inverseGloss': "has variant"},
+    'subject': {'relationGloss': "involves subject", 'inverseGloss': "appears in type"},
+    'literature': {'relationGloss': "has relevant literature", 'inverseGloss': "concerns or features"},
+    'reference': {'relationGloss': "full citation", 'inverseGloss': "cited as"},
+    'tradition': {'relationGloss': "documents or analyzes", 'inverseGloss': "is featured in"},
+    'combo': {'relationGloss': "sometimes combined with", 'inverseGloss': "sometimes combined with"},
+    'see': {'relationGloss': "see also", 'inverseGloss': "see also"},
+                }
+
+
+# One function per named statement in neo4jUtils and asyncIngest. Each takes
+# the statement's parameters and returns (records, counters) like the Cypher.
+
+
+def createNodes(p:dict, c:SimpleNamespace)->list:
+    for node in p['nodes']:
+        createNode([p['label']], node, c)
+    return []
+
+
+def createRelationships(p:dict, c:SimpleNamespace)->list:
+    records:list = []
+    for s in matchNodes(p['source_label'], p['source_key'], p['source']):
+        for target in p['targets']:
+            for t in matchNodes(p['target_label'], p['target_key'], target['id']):
+                createRel(s, p['relation'], t, target['props'], c)
+                records.append({'target': prop(t, p['target_key'])})
+    return records
+
+
+def createRelationshipBatch(p:dict, c:SimpleNamespace)->list:
+    missing:dict = {}
+    for pair in p['pairs']:
+        sources:list[int] = matchNodes(p['source_label'], p['source_key'], pair['source'])
+        for target in pair['targets']:
+            hits:int = 0
+            for s in sources:
+                for t in matchNodes(p['target_label'], p['target_key'], target['id']):
+                    createRel(s, p['relation'], t, target['props'], c)
+                    hits += 1
+            if hits == 0:
+                missing.setdefault(pair['source'], []).append(target['id'])
+    return [{'source': k, 'missing': v} for k, v in missing.items()]
+
+
+def createATUClass(p:dict, c:SimpleNamespace)->list:
+    n:int = createNode(["class"], p['node'], c)
+    for s in matchNodes("class", "uuid", p['super']):
+        createRel(n, "superclass", s, glosses['superclass'], c)
+    return []
+
+
+def writeATUClassTree(p:dict, c:SimpleNamespace)->list:
+    created:dict = {k['node']['uuid']: createNode(["class"], k['node'], c) for k in p['classes']}
+    for k in p['classes']:
+        for s in matchNodes("class", "uuid", k['super']):
+            createRel(created[k['node']['uuid']], "superclass", s, glosses['superclass'], c)
+    for m in p['members']:
+        for a in matchNodes("atu", "atu", m['atu']):
+            for k in matchNodes("class", "uuid", m['cls']):
+                createRel(a, "class", k, glosses['class'], c)
+    return []
+
+
+def classifyATUs(p:dict, c:SimpleNamespace)->list:
+    for atu in p['atus']:
+        for a in matchNodes("atu", "atu", atu):
+            for k in matchNodes("class", "title", p['cls']):
+                createRel(a, "class", k, glosses['class'], c)
+    return []
+
+
+def classifyRetiredATUs(p:dict, c:SimpleNamespace)->list:
+    u:int = createNode(["class"], {'title': "Discontinued ATU", 'uuid': p['cuuid']}, c)
+    for s in matchNodes("class", "title", "ATU"):
+        createRel(u, "superclass", s, glosses['superclass'], c)
+        for a in matchNodes("atu", "description", "Combined with another type as per title."):
+            createRel(a, "class", u, glosses['class'], c)
+    return []
+
+
+def getRetiredATUs(p:dict, c:SimpleNamespace)->list:
+    records:list = []
+    for n in matchNodes("class", "title", "Discontinued ATU"):
+        for r in memory_graph['in'][n]:
+            a:int = memory_graph['rels'][r]['start']
+            if hasLabel(a, "atu"):
+                records.append({'discontinued': prop(a, "atu"), 'title': prop(a, "title")})
+    return records
+
+
+def linkPairs(p:dict, c:SimpleNamespace, label:str, rel_type:str)->list:
+    for k, v in p['links'].items():
+        for d in matchNodes(label, label, k):
+            for a in matchNodes(label, label, v):
+                createRel(d, rel_type, a, glosses[rel_type], c)
+    return []
+
+
+def getMotifs(p:dict, c:SimpleNamespace)->list:
+    return [{'motif': prop(m, "motif")} for m in matchNodes("motif")]
+
+
+def classifyTraditions(p:dict, c:SimpleNamespace)->list:
+    k:int = createNode(["class"], {'title': p['class_title'], 'uuid': p['cuuid']}, c)
+    for s in matchNodes("class", "title", "Tradition"):
+        if prop(s, "uuid") != "58e1b5dc-4010-431e-bcf7-d84b62e69d0c":
+            continue
+        createRel(k, "superclass", s, glosses['superclass'], c)
+        for trad in p['traditions']:
+            t:int = createNode(["tradition"], {'title': trad}, c)
+            createRel(t, "class", k, glosses['class'], c)
+    return []
+
+
+def citeRefs(atu:str, refs:dict, c:SimpleNamespace)->list[tuple]:
+    """The shared body of createCitations and writeCitationBatch: one
+    (ref, tradition) row per citation node created."""
+    rows:list[tuple] = []
+    for a in matchNodes("atu", "atu", atu):
+        for trad, trad_refs in refs.items():
+            for t in matchNodes("tradition", "title", trad) or [None]:
+                for ref in trad_refs:
+                    for r in matchNodes("ref", "ref", ref['citation']):
+                        n:int = createNode(["citation", "EXP"], {'from': ref['raw']}, c)
+                        createRel(a, "literature", n, glosses['literature'], c)
+                        createRel(n, "reference", r, glosses['reference'], c)
+                        if t is not None:
+                            createRel(n, "tradition", t, glosses['tradition'], c)
+                        rows.append((prop(r, "ref"), prop(t, "title") if t is not None else None))
+    return rows
+
+
+def createCitations(p:dict, c:SimpleNamespace)->list:
+    return [{'ref': ref, 'trad': trad} for ref, trad in citeRefs(p['atu'], p['refs'], c)]
+
+
+def createCitationBatch(p:dict, c:SimpleNamespace)->list:
+    grouped:dict = {}
+    for i, item in enumerate(p['batch']):
+        for ref, trad in citeRefs(item['atu'], item['refs'], c):
+            grouped.setdefault((i, trad), []).append(ref)
+    return [{'i': i, 'trad': trad, 'refs': refs} for (i, trad), refs in grouped.items()]
+
+
+def removeCitations(p:dict, c:SimpleNamespace)->list:
+    citations:list[int] = matchNodes("citation")
+    linked:bool = any(hasLabel(memory_graph['rels'][r]['end'], "tradition")
+                      for n in citations for r in memory_graph['out'][n])
+    if linked:
+        for n in citations:
+            deleteNode(n, c)
+    return []
+
+
+def fixCitations(p:dict, c:SimpleNamespace)->list:
+    for fix, ref in p['fixes'].items():
+        for r in matchNodes("ref", "ref", fix):
+            setProperty(r, "ref", ref, c)
+    return []
+
+
+def createSubject(p:dict, c:SimpleNamespace)->list:
+    createNode(["subject"], {'title': p['main'], 'uuid': p['muuid']}, c)
+    return []
+
+
+def subjectEntry(m:int, title:str, suuid:str, atus:list[str], c:SimpleNamespace):
+    s:int = createNode(["subject"], {'title': title, 'uuid': suuid}, c)
+    createRel(s, "parent", m, glosses['parent'], c)
+    for atu in atus:
+        for a in matchNodes("atu", "atu", atu):
+            createRel(a, "subject", s, glosses['subject'], c)
+
+
+def linkSubjectEntry(p:dict, c:SimpleNamespace)->list:
+    for m in matchNodes("subject", "uuid", p['muuid']):
+        subjectEntry(m, p['sub'], p['suuid'], p['atus'], c)
+    return []
+
+
+def createSubjectTree(p:dict, c:SimpleNamespace)->list:
+    m:int = createNode(["subject"], {'title': p['main'], 'uuid': p['muuid']}, c)
+    for sub in p['subs']:
+        subjectEntry(m, sub['title'], sub['uuid'], sub['atus'], c)
+    return []
+
+
+def createRemarks(p:dict, c:SimpleNamespace)->list:
+    for atu, remarks in p['remarks'].items():
+        for a in matchNodes("atu", "atu", atu):
+            setProperty(a, "remarks", remarks, c)
+    return []
+
+
+def linkCombos(p:dict, c:SimpleNamespace)->list:
+    for atu0, partners in p['combos'].items():
+        for atu1 in partners:
+            for s in matchNodes("atu", "atu", atu0):
+                for t in matchNodes("atu", "atu", atu1):
+                    mergeUndirected(s, "combo", t, glosses['combo'], c)
+    return []
+
+
+def linkSubjects(p:dict, c:SimpleNamespace)->list:
+    records:list = []
+    for subj1 in p['targets']:
+        for s in matchNodes("subject", "title", p['source']):
+            for t in matchNodes("subject", "title", subj1):
+                mergeUndirected(s, "see", t, glosses['see'], c)
+                records.append({'source': prop(s, "title"), 'target': prop(t, "title")})
+    return records
+
+
+operations:dict = {
+    'createNodeSet': createNodes,
+    'writeNodeBatch': createNodes,
+    'creatRelSet': createRelationships,
+    'writeRelBatch': createRelationshipBatch,
+    'createATUClass': createATUClass,
+    'writeATUClassTree': writeATUClassTree,
+    'classifyATUs': classifyATUs,
+    'classifyRetiredATUs': classifyRetiredATUs,
+    'getRetiredATUs': getRetiredATUs,
+    'linkRetiredATUs': lambda p, c: linkPairs(p, c, "atu", "discontinued"),
+    'getMotifs': getMotifs,
+    'linkMotifs': lambda p, c: linkPairs(p, c, "motif", "parent"),
+    'classifyTraditions': classifyTraditions,
+    'createCitations': createCitations,
+    'writeCitationBatch': createCitationBatch,
+    'removeCitations': removeCitations,
+    'fixCitations': fixCitations,
+    'createSubject': createSubject,
+    'linkSubjectEntry': linkSubjectEntry,
+    'createSubjectTree': createSubjectTree,
+    'createRemarks': createRemarks,
+    'linkCombos': linkCombos,
+    'linkSubjects': linkSubjects,
+                }
+
+
+def runOperation(name:str, params:dict)->tuple:
+    """Run a named statement against the in-memory graph. Returns the records
+    (dicts, read like neo4j Records with [] or .get) and the counters."""
+    if name not in operations:
+        raise KeyError("No in-memory implementation of {}.".format(name))
+    counters:SimpleNamespace = memoryCounters()
+    records:list = operations[name](params, counters)
+    return records, counters
+
+
+def graphStats()->dict:
+    """Node counts per label and relationship counts per type."""
+    rel_types:dict = {}
+    for rel in memory_graph['rels'].values():
+        rel_types[rel['type']] = rel_types.get(rel['type'], 0) + 1
+    return {'nodes': {k: len(v) for k, v in memory_graph['labels'].items() if v},
+            'relationships': rel_types}
@@ -0,0 +1,130 @@
+from bisect import bisect_left, bisect_right
+from math import inf
+import re
+
+
+# TMI motif codes as sortable keys: "K341.2" is ('K', 341, 2) and a chapter head
+# like "K0" is ('K', 0). Sorted keys put every motif right after its parent and
+# before its next sibling, so the descendants of a code are one contiguous run
+# of a sorted array, found with two bisections.
+motif_pattern = re.compile(r"([A-Z]+)(\d+(?:\.\d+)*)")
+
+
+def motifKey(code:str)->tuple:
+    """The key of a TMI code, or None if it is not one (a type, a word, a verse)."""
+    m = motif_pattern.fullmatch(code.strip().replace(" ", ""))
+    if m is None:
+        return None
+    return (m.group(1),) + tuple(int(n) for n in m.group(2).split("."))
+
+
+def motifCode(key:tuple)->str:
+    return key[0] + ".".join(str(n) for n in key[1:])
+
+
+def parentKey(key:tuple)->tuple:
+    """A motif's parent: its chapter head for "K341", None for the head "K0",
+    and otherwise the code one level up, skipping a ".0" level ("T74.0.1" is
+    filed under "T74", "K0.1" under the chapter head "K0")."""
+    if len(key) == 2:
+        return None if key[1] == 0 else (key[0], 0)
+    if key[-2] == 0:
+        return key[:-2] if len(key) > 3 else (key[0], 0)
+    return key[:-1]
+
+
+def motifParent(code:str)->str:
+    key:tuple = motifKey(code)
+    parent:tuple = parentKey(key) if key is not None else None
+    return motifCode(parent) if parent is not None else None
+
+
+def motifAncestors(code:str)->list[str]:
+    """Parent, grandparent and so on up to the chapter head."""
+    ancestors:list[str] = []
+    key:tuple = motifKey(code)
+    while key is not None and (key := parentKey(key)) is not None:
+        ancestors.append(motifCode(key))
+    return ancestors
+
+
+def buildMotifIndex(codes)->dict:
+    """A sorted array of the keys of codes, with the code each key came from."""
+    index:dict = {'keys': [], 'codes': {}}
+    for c in codes:
+        key:tuple = motifKey(c)
+        if key is not None:
+            index['codes'].setdefault(key, c)
+    index['keys'] = sorted(index['codes'])
+    return index
+
+
+def keyRange(index:dict, low:tuple, high:tuple)->list[str]:
+    """The indexed codes with low <= key < high."""
+    keys:list[tuple] = index['keys']
+    return [index['codes'][k] for k in keys[bisect_left(keys, low):bisect_left(keys, high)]]
+
+
+def motifDescendants(index:dict, code:str)->list[str]:
+    """Every indexed motif below code, in TMI order."""
+    key:tuple = motifKey(code)
+    if key is None:
+        return []
+    if parentKey(key) is None:
+        return keyRange(index, key + (-inf,), (key[0], inf))
+    return keyRange(index, key + (-inf,), key + (inf,))
+
+
+def motifChildren(index:dict, code:str)->list[str]:
+    key:tuple = motifKey(code)
+    return [d for d in motifDescendants(index, code) if parentKey(motifKey(d)) == key]
+
+
+def motifSiblings(index:dict, code:str)->list[str]:
+    """The other indexed motifs with the same parent."""
+    key:tuple = motifKey(code)
+    parent:tuple = parentKey(key) if key is not None else None
+    if parent is None:
+        return []
+    return [c for c in motifChildren(index, motifCode(parent)) if motifKey(c) != key]
+
+
+def motifsBetween(index:dict, start:str, end:str)->list[str]:
+    """The indexed motifs from start through end, end's own sub-motifs included."""
+    keys:list[tuple] = index['keys']
+    low:int = bisect_left(keys, motifKey(start))
+    high:int = bisect_right(keys, motifKey(end) + (inf,))
+    return [index['codes'][k] for k in keys[low:high]]
+
+
+def expandRange(text:str, index:dict=None)->list[str]:
+    """The codes a range like "K341.2–K341.5" stands for. The end may omit the
+    letter ("X1030–1036"), and a start one level up is included before its
+    children ("F613–F613.4" is F613, F613.1, ..., F613.4). Ranges whose ends
+    do not line up are answered from index, if given."""
+    start, end = (s.strip() for s in text.split("–", 1))
+    start_key:tuple = motifKey(start)
+    if start_key is not None and end[:1].isdigit():
+        end = start_key[0] + end
+    end_key:tuple = motifKey(end)
+    if start_key is None or end_key is None:
+        return []
+    if start_key == end_key[:-1]:
+        return [start] + [motifCode(end_key[:-1] + (i,)) for i in range(1, end_key[-1] + 1)]
+    if start_key[:-1] == end_key[:-1]:
+        return [motifCode(start_key[:-1] + (i,)) for i in range(start_key[-1], end_key[-1] + 1)]
+    return motifsBetween(index, start, end) if index is not None else [start, end]
+
+
+def motifLinks(codes)->dict:
+    """The parent of every motif that has one, grouped by chapter letter."""
+    links:dict = {}
+    for c in codes:
+        key:tuple = motifKey(c)
+        if key is None:
+            continue
+        chapter:dict = links.setdefault(key[0], {})
+        parent:tuple = parentKey(key)
+        if parent is not None:
+            chapter[c] = motifCode(parent)
+    return links
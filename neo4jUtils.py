@@ -1,50 +1,449 @@
-from neo4j import GraphDatabase, Driver, Result
-from streamlit import secrets
-from json import load, dump
+from json import load, dump, JSONDecoder
 from log import f_logger
+from journal import readJournal, appendJournal, clearJournal
+from atuStore import atuRecords
+from corpusCache import corpusName, iterCorpus
+from motifIndex import expandRange, motifLinks
 from uuid import uuid4 as getUUID
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from threading import Lock
+from os import getpid
+from time import perf_counter
+from typing import TYPE_CHECKING
+import atexit
+import memoryGraph
+import sqliteStore
+
+# The driver and the secrets are only imported once a connection is needed, so 
+# that loading this module (and the parsers that use it) stays cheap.
+if TYPE_CHECKING:
+    from neo4j import Driver, Session
 
 
 label_dicts = {
     'atu': {'file':'data/atu.json', 
             'props':["atu","title","description"],
+            'key':"atu",
             'motifs':{'target':'motif', 'props':{'relationGloss': "has motif", 'inverseGloss':"motif in"}}},
     'motif': {'file':'data/tmi.json', 
-            'props':["motif","description","additional_description"]},
+            'props':["motif","description","additional_description"],
+            'key':"motif"},
     'ref': {'file':'data/citations.json', 
-            'props':["ref","citation"]},
+            'props':["ref","citation"],
+            'key':"ref"},
                       }
 
 
-def openGraph() -> Driver:
-    """ """
-    s = secrets
-    driver = GraphDatabase.driver(s["NEO4J_URI"], auth=(s["NEO4J_USER"], s["NEO4J_PASSWORD"]))
-    return driver
+# Lookup keys for labels that are not loaded from a file in label_dicts. Only 
+# uuids are guaranteed unique; atu, ref and title values repeat in the data.
+schema_keys = {
+    'class': {'unique': ["uuid"], 'index': ["title"]},
+    'subject': {'unique': ["uuid"], 'index': ["title"]},
+    'tradition': {'unique': [], 'index': ["title"]},
+                      }
+
+
+pool_settings:dict = {'max_connection_pool_size': 50,
+                      'connection_acquisition_timeout': 60.0,
+                      'max_connection_lifetime': 3600}
+shared_graph:dict = {'driver': None, 'pid': None, 'schema': False}
+graph_lock = Lock()
+schema_lock = Lock()
+
+# Where runQuery sends statements: "neo4j" for the server, "memory" for the 
+# in-process graph in memoryGraph, "sqlite" for the read-only sqliteStore.
+graph_backend:dict = {'name': "neo4j"}
+
+# Opt-in per-statement timings, counters and PROFILE plans; see profileQueries().
+query_profile:dict = {'enabled': False, 'plans': 0, 'stats': {}}
+profile_lock = Lock()
+
+
+def configureGraph(**settings)->dict:
+    """Change the connection pool settings (pool size, acquisition timeout, 
+    max connection lifetime). An open shared driver is closed so that the next 
+    call to openGraph() picks the new settings up."""
+    unknown = set(settings) - set(pool_settings)
+    if unknown:
+        raise KeyError("Unknown pool setting(s): {}".format(unknown))
+    closeGraph()
+    pool_settings.update(settings)
+    return pool_settings
+
+
+def openGraph() -> "Driver":
+    """Return the process-wide driver, creating it on first use. Pool settings 
+    come from pool_settings, overridable by upper-case entries in the secrets."""
+    with graph_lock:
+        if shared_graph['driver'] is None or shared_graph['pid'] != getpid():
+            from neo4j import GraphDatabase
+            from streamlit import secrets
+            s = secrets
+            settings = {k: s.get(k.upper(), v) for k, v in pool_settings.items()}
+            shared_graph['driver'] = GraphDatabase.driver(s["NEO4J_URI"], 
+                                                          auth=(s["NEO4J_USER"], s["NEO4J_PASSWORD"]), 
+                                                          **settings)
+            shared_graph['pid'] = getpid()
+        return shared_graph['driver']
+
+
+def closeGraph():
+    """Explicitly shut down the shared driver and its connection pool."""
+    with graph_lock:
+        driver:Driver = shared_graph['driver']
+        if driver is not None and shared_graph['pid'] == getpid():
+            driver.close()
+        shared_graph['driver'] = None
+        shared_graph['pid'] = None
+    with schema_lock:
+        shared_graph['schema'] = False
+
+
+atexit.register(closeGraph)
+
+
+@contextmanager
+def graphSession(database:str="neo4j")->"Session":
+    """Borrow a session from the shared driver's pool for the duration of a 
+    with block. The schema is bootstrapped before the first session is handed out."""
+    ensureSchema(database)
+    with openGraph().session(database=database) as session:
+        yield session
+
+
+def useBackend(name:str, reset:bool=True)->str:
+    """Switch runQuery between the Neo4j server ("neo4j"), the in-memory 
+    graph ("memory"), which is emptied first unless reset is False, and the 
+    read-only SQLite store ("sqlite")."""
+    if name not in ("neo4j", "memory", "sqlite"):
+        raise KeyError("Unknown graph backend: {}".format(name))
+    if name == "memory" and reset:
+        memoryGraph.resetMemoryGraph()
+    graph_backend['name'] = name
+    return name
+
+
+def backendJournal(name:str)->str:
+    """The journal to use for name on the active backend. The memory graph does 
+    not outlive it, so memory journals start empty with every fresh graph."""
+    if graph_backend['name'] != "memory":
+        return name
+    name = "{}.memory".format(name)
+    if name not in memoryGraph.memory_graph['journals']:
+        clearJournal(name)
+        memoryGraph.memory_graph['journals'].add(name)
+    return name
+
+
+def eagerQuery(tx, query:str, params:dict)->tuple:
+    """Run a statement in a session or transaction and read it to the end."""
+    result = tx.run(query, params)
+    records:list = list(result)
+    return records, result.consume()
+
+
+def runQuery(name:str, query:str, params:dict=None, write:bool=False, database:str="neo4j")->tuple:
+    """Run the statement called name on the active backend and return its 
+    records and counters. On Neo4j, write statements go through a managed 
+    write transaction and the rest run in an auto-commit transaction; the 
+    memory and sqlite backends run their own implementation of the statement."""
+    params = params or {}
+    start:float = perf_counter()
+    if graph_backend['name'] in ("memory", "sqlite"):
+        backend = memoryGraph if graph_backend['name'] == "memory" else sqliteStore
+        records, counters = backend.runOperation(name, params)
+        recordQuery(name, params, perf_counter() - start, counters)
+        return records, counters
+    query = profiledQuery(name, query)
+    with graphSession(database) as session:
+        if write:
+            records, summary = session.execute_write(eagerQuery, query, params)
+        else:
+            records, summary = eagerQuery(session, query, params)
+    recordQuery(name, params, perf_counter() - start, summary.counters, summary)
+    return records, summary.counters
+
+
+def profileQueries(enabled:bool=True, plans:int=0)->dict:
+    """Start recording every runQuery (and asyncIngest) statement: parameter 
+    sizes, server and client timings and counters. The first plans executions 
+    of each statement are run with PROFILE to capture db hits and rows. 
+    Starting clears the previous recording; profileReport() summarises it."""
+    with profile_lock:
+        query_profile['enabled'] = enabled
+        query_profile['plans'] = plans
+        if enabled:
+            query_profile['stats'] = {}
+    return query_profile
+
+
+def profiledQuery(name:str, query:str)->str:
+    """Prefix query with PROFILE while the statement still has plans to capture."""
+    if not query_profile['enabled']:
+        return query
+    with profile_lock:
+        stat:dict = query_profile['stats'].get(name)
+        captured:int = stat['profiled'] if stat is not None else 0
+        if captured >= query_profile['plans']:
+            return query
+        query_profile['stats'].setdefault(name, newQueryStat())['profiled'] += 1
+    return "PROFILE " + query
+
+
+def newQueryStat()->dict:
+    return {'calls': 0, 'seconds': 0.0, 'available_ms': 0, 'consumed_ms': 0, 
+            'param_items': 0, 'profiled': 0, 'db_hits': 0, 'rows': 0, 
+            'counters': {}, 'plan': None}
+
+
+def paramSize(value)->int:
+    """Number of items a parameter sends: the length of lists and maps, else 1."""
+    return len(value) if isinstance(value, (list, dict)) else 1
+
+
+def planTotals(plan:dict)->tuple:
+    """Sum the db hits of a PROFILE plan tree; rows are those of the root operator."""
+    hits:int = plan.get('dbHits', 0)
+    for child in plan.get('children', []):
+        hits += planTotals(child)[0]
+    return hits, plan.get('rows', 0)
+
+
+def recordQuery(name:str, params:dict, seconds:float, counters, summary=None):
+    """Fold one execution of a statement into query_profile."""
+    if not query_profile['enabled']:
+        return
+    with profile_lock:
+        stat:dict = query_profile['stats'].setdefault(name, newQueryStat())
+        stat['calls'] += 1
+        stat['seconds'] += seconds
+        stat['param_items'] += sum(paramSize(v) for v in params.values())
+        for k, v in vars(counters).items():
+            if isinstance(v, int) and not isinstance(v, bool) and v:
+                stat['counters'][k] = stat['counters'].get(k, 0) + v
+        if summary is None:
+            return
+        stat['available_ms'] += summary.result_available_after or 0
+        stat['consumed_ms'] += summary.result_consumed_after or 0
+        if summary.profile:
+            hits, rows = planTotals(summary.profile)
+            stat['db_hits'] += hits
+            stat['rows'] += rows
+            if stat['plan'] is None:
+                stat['plan'] = summary.profile
+
+
+def profileReport(file_name:str="logs/query_profile.json")->list[dict]:
+    """Rank the recorded statements by total client time, then db hits, log 
+    the ranking and save it with the captured plans."""
+    logger = f_logger()
+    with profile_lock:
+        ranked:list[dict] = [dict(stat, name=name) for name, stat in query_profile['stats'].items()]
+    ranked.sort(key=lambda r: (r['seconds'], r['db_hits']), reverse=True)
+    lines:list[str] = ["{:<22} {:>6} {:>9} {:>9} {:>9} {:>10} {:>9}".format(
+        "statement", "calls", "total s", "avail ms", "cons ms", "db hits", "params")]
+    for r in ranked:
+        lines.append("{:<22} {:>6} {:>9.3f} {:>9} {:>9} {:>10} {:>9}".format(
+            r['name'], r['calls'], r['seconds'], r['available_ms'], r['consumed_ms'], 
+            r['db_hits'], r['param_items']))
+    logger.info("Query profile:\n{}", "\n".join(lines))
+    if file_name is not None:
+        with open(file_name, 'w', encoding="utf-8") as f:
+            dump(ranked, f, indent=1, ensure_ascii=False, default=str)
+    return ranked
+
+
+def schemaStatements()->list[tuple]:
+    """List (name, create, drop) Cypher for every constraint and index on a 
+    TOMES node key, driven by label_dicts and schema_keys."""
+    keys:dict = {label: {'unique': [], 'index': [d['key']]} for label, d in label_dicts.items()}
+    keys.update(schema_keys)
+    statements:list[tuple] = []
+    for label, k in keys.items():
+        for prop in k['unique']:
+            name = "{}_{}_unique".format(label, prop)
+            statements.append((name, 
+                               "CREATE CONSTRAINT {} IF NOT EXISTS FOR (n:{}) REQUIRE n.{} IS UNIQUE".format(name, label, prop), 
+                               "DROP CONSTRAINT {} IF EXISTS".format(name)))
+        for prop in k['index']:
+            name = "{}_{}".format(label, prop)
+            statements.append((name, 
+                               "CREATE INDEX {} IF NOT EXISTS FOR (n:{}) ON (n.{})".format(name, label, prop), 
+                               "DROP INDEX {} IF EXISTS".format(name)))
+    return statements
+
+
+def createSchema(database:str="neo4j", timeout:int=300)->int:
+    """Idempotently create the constraints and indexes, then wait for them to 
+    come online. Returns the number of schema items actually added."""
+    added:int = 0
+    with openGraph().session(database=database) as session:
+        for _, create, _ in schemaStatements():
+            summary = session.run(create).consume()
+            added += summary.counters.constraints_added + summary.counters.indexes_added
+        session.run("CALL db.awaitIndexes($timeout)", timeout=timeout).consume()
+    shared_graph['schema'] = True
+    return added
+
+
+def dropSchema(database:str="neo4j")->int:
+    """Remove the constraints and indexes created by createSchema(). The next 
+    session of this process creates them again."""
+    removed:int = 0
+    with openGraph().session(database=database) as session:
+        for _, _, drop in schemaStatements():
+            summary = session.run(drop).consume()
+            removed += summary.counters.constraints_removed + summary.counters.indexes_removed
+    with schema_lock:
+        shared_graph['schema'] = False
+    return removed
+
+
+def ensureSchema(database:str="neo4j"):
+    """Run createSchema() once per process, before any loader writes. The flag
+    is only set once createSchema() returns, so a failed attempt is retried."""
+    with schema_lock:
+        if not shared_graph['schema']:
+            createSchema(database)
+
+
+def labelItems(node_label:str):
+    """The entries of a label's source file. ATUs come from the shared dataset 
+    in atuStore instead of a fresh parse of atu.json, other corpora from their
+    compiled cache."""
+    label_dict = label_dicts[node_label]
+    if label_dict['file'] == "data/atu.json":
+        return atuRecords()
+    name:str = corpusName(label_dict['file'])
+    if name is not None:
+        return list(iterCorpus(name))
+    with open(label_dict['file'],"r",encoding='utf-8') as f:
+        return load(f)
 
 
 def createNodeList(node_label:str)->list[dict]:
     """ """
     label_dict = label_dicts[node_label]
-    with open(label_dict['file'],"r",encoding='utf-8') as f:
-        item_list = load(f)
+    item_list = labelItems(node_label)
     return [ { k : v for k, v in x.items() if k in label_dict['props'] and v != ""} for x in item_list]
 
 
-def createNodeSet(node_label:str)->Result:
+def createNodeSet(node_label:str):
     """ """
-    graph = openGraph()
     nodes = createNodeList(node_label)
-    with graph.session(database="neo4j") as session:
-        res:Result = session.run("""
+    _, counters = runQuery("createNodeSet", """
                         WITH $nodes AS batch
                         UNWIND batch AS node
                         CREATE (n:{})
                         SET n = node
-                        """.format(node_label), nodes=nodes,
-                            )
-    graph.close()
-    return res
+                        """.format(node_label), {'nodes': nodes, 'label': node_label})
+    return counters
+
+
+def iterJSONArray(file_name:str, buffer_size:int=65536):
+    """Yield the elements of a top-level JSON array one at a time, reading the 
+    file in buffer_size pieces rather than loading it whole."""
+    decoder = JSONDecoder()
+    with open(file_name, "r", encoding='utf-8') as f:
+        buf:str = f.read(buffer_size).lstrip()
+        if not buf.startswith("["):
+            raise ValueError("{} does not contain a JSON array.".format(file_name))
+        pos:int = 1
+        eof:bool = False
+        while True:
+            while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ","):
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+                if end == len(buf) and not eof:
+                    raise ValueError("Element may continue past the buffer.")
+            except ValueError:
+                more:str = f.read(buffer_size)
+                if more == "":
+                    if eof:
+                        raise
+                    eof = True
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+            yield item
+            pos = end
+
+
+def streamNodeList(node_label:str, batch_size:int):
+    """Lazily produce the nodes of createNodeList in batches of batch_size, 
+    filtering props as each element is read."""
+    label_dict = label_dicts[node_label]
+    props:list[str] = label_dict['props']
+    name:str = corpusName(label_dict['file'])
+    if label_dict['file'] == "data/atu.json":
+        source = atuRecords()
+    else:
+        source = iterCorpus(name) if name is not None else iterJSONArray(label_dict['file'])
+    items = ({ k : v for k, v in x.items() if k in props and v != ""} for x in source)
+    while True:
+        batch:list[dict] = list(islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def writeNodeBatch(node_label:str, nodes:list[dict])->int:
+    """Write one batch of streamNodeSet in its own transaction."""
+    _, counters = runQuery("writeNodeBatch", """
+                    UNWIND $nodes AS node
+                    CREATE (n:{})
+                    SET n = node
+                    """.format(node_label), {'nodes': nodes, 'label': node_label}, write=True)
+    return counters.nodes_created
+
+
+def commitNodeBatch(node_label:str, b:int, nodes:list[dict], journal:str)->tuple:
+    """Write one batch and journal it once committed."""
+    start:float = perf_counter()
+    created:int = writeNodeBatch(node_label, nodes)
+    appendJournal(journal, b)
+    return b, created, perf_counter() - start
+
+
+def reportNodeBatch(outcome:tuple, report:dict, logger):
+    """Fold one committed batch into the running report."""
+    b, created, elapsed = outcome
+    report['batches'] += 1
+    report['nodes'] += created
+    logger.success("Batch {}: {} nodes in {:.2f}s.", b, created, elapsed)
+
+
+def streamNodeSet(node_label:str, batch_size:int=1000, workers:int=1, resume:bool=True)->dict:
+    """Streaming, chunked alternative to createNodeSet. Batches of batch_size 
+    nodes are written by up to workers concurrent transactions; each committed 
+    batch is journaled so an interrupted load resumes after it."""
+    logger = f_logger()
+    journal:str = backendJournal("{}_nodes_{}".format(node_label, batch_size))
+    if not resume:
+        clearJournal(journal)
+    done:set[str] = readJournal(journal)
+    report:dict = {'batches': 0, 'nodes': 0, 'skipped': 0}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending:set = set()
+        for b, nodes in enumerate(streamNodeList(node_label, batch_size)):
+            if str(b) in done:
+                report['skipped'] += 1
+                continue
+            if len(pending) >= workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    reportNodeBatch(fut.result(), report, logger)
+            pending.add(pool.submit(commitNodeBatch, node_label, b, nodes, journal))
+        for fut in pending:
+            reportNodeBatch(fut.result(), report, logger)
+    logger.success("{} nodes created in {} batches ({} already committed).",
+        report['nodes'], report['batches'], report['skipped'])
+    return report
 
 
 def cleanTargets(targs:list[str], base_props:dict)->list[str]:
@@ -68,127 +467,184 @@ def cleanTargets(targs:list[str], base_props:dict)->list[str]:
                     s_dict['id'] = spl
                     final.append(s_dict)
             if "–" in s:
-                sp = s.split("–")
-                pref:str = s[0]
-                start_raw = sp[0]
-                end_raw = sp[1]
-                start = start_raw[1:] if start_raw[0].isalpha() else start_raw
-                end = end_raw[1:] if end_raw[0].isalpha() else end_raw
-                if "." in end:
-                    e_split = end.split(".")
-                    end = e_split[-1]
-                    pref = pref + ".".join(e_split[:-1]) + "."
-                    if "." in start:
-                        s_split =  start.split(".")
-                        start = s_split[-1]
-                    else:
-                        start = 0
-                print(s,start,end)
-                for i in range(int(start), int(end) + 1):
+                for code in expandRange(s):
                     r_dict:dict = s_dict.copy()
-                    r_dict['id'] = start_raw if i == 0 else pref + str(i)
+                    r_dict['id'] = code
                     final.append(r_dict)
             else:
                 final.append(s_dict)
     return final
 
 
-def creatRelSet(source_label:str, relation: str)->Result:
+def creatRelSet(source_label:str, relation: str)->dict:
     """ """
-    graph = openGraph()
     label_dict:dict = label_dicts[source_label]
     logger = f_logger()
     rel_count:int = 0
     update:int = 0
     missed_targets:dict = {}
-    with open(label_dict['file'],"r",encoding='utf-8') as f:
-        item_list:list[dict] = load(f)
-    with graph.session(database="neo4j") as session:
-        for i in item_list:
-            source:str = i[source_label]
-            targets:list[str] = i.get(relation)
-            if targets is not None:
-                rel_def = label_dict[relation]
-                props = rel_def['props']
-                targets = cleanTargets(targets, props)
-                target_label = rel_def['target']
-                results, summary, keys = session.run("""
-                                WITH $targets AS targets
-                                UNWIND targets AS target
-                                MATCH (s:{} {{ {}:$source }})
-                                MATCH (t:{} {{ {}:target.id }})
-                                CREATE (s)-[r:{}]->(t)
-                                SET r = target.props
-                                RETURN t['{}']
-                                """.format(source_label, source_label, 
-                                        target_label, target_label, 
-                                        relation, target_label), 
-                                source=source, 
-                                targets=targets
-                                    ).to_eager_result()
-                c = summary.counters.relationships_created
-                rel_count += c
-                update += c
-                if update > 1000:
-                    logger.success("{} relationships so far.".format(rel_count))
-                    update = 0
-                res = set([r[keys[0]] for r in results])
-                targs = set([x['id'] for x in targets])
-                missing = targs - res 
-                if len(missing) > 0:
-                    logger.warning("{} was expected but not created for {}.".format(missing, source))
-                    for m in missing:
-                        missing_sources:list = missed_targets.get(m)
-                        if missing_sources is None:
-                            missed_targets[m] = [source]
-                        else:
-                            missing_sources.append(source)
-                            missed_targets[m] = missing_sources
-    graph.close()
-    logger.success("{} relationships so far.".format(rel_count))
+    item_list = labelItems(source_label)
+    for i in item_list:
+        source:str = i[source_label]
+        targets:list[str] = i.get(relation)
+        if targets is not None:
+            rel_def = label_dict[relation]
+            props = rel_def['props']
+            targets = cleanTargets(targets, props)
+            target_label = rel_def['target']
+            results, counters = runQuery("creatRelSet", """
+                            WITH $targets AS targets
+                            UNWIND targets AS target
+                            MATCH (s:{} {{ {}:$source }})
+                            MATCH (t:{} {{ {}:target.id }})
+                            CREATE (s)-[r:{}]->(t)
+                            SET r = target.props
+                            RETURN t.{} AS target
+                            """.format(source_label, source_label, 
+                                    target_label, target_label, 
+                                    relation, target_label), 
+                            {'source': source, 'targets': targets, 
+                             'source_label': source_label, 'source_key': source_label, 
+                             'target_label': target_label, 'target_key': target_label, 
+                             'relation': relation})
+            c = counters.relationships_created
+            rel_count += c
+            update += c
+            if update > 1000:
+                logger.success("{} relationships so far.", rel_count)
+                update = 0
+            res = set([r['target'] for r in results])
+            targs = set([x['id'] for x in targets])
+            missing = targs - res 
+            if len(missing) > 0:
+                logger.warning("{} was expected but not created for {}.", missing, source)
+                for m in missing:
+                    missing_sources:list = missed_targets.get(m)
+                    if missing_sources is None:
+                        missed_targets[m] = [source]
+                    else:
+                        missing_sources.append(source)
+                        missed_targets[m] = missing_sources
+    logger.success("{} relationships so far.", rel_count)
+    return missed_targets
+
+
+def relationPairs(source_label:str, relation:str)->list[dict]:
+    """Read the source file for a label and pair each source key with its 
+    cleaned relation targets."""
+    label_dict:dict = label_dicts[source_label]
+    rel_def:dict = label_dict[relation]
+    item_list = labelItems(source_label)
+    pairs:list[dict] = []
+    for i in item_list:
+        targets:list[str] = i.get(relation)
+        if targets is not None:
+            pairs.append({'source': i[source_label], 
+                          'targets': cleanTargets(targets, rel_def['props'])})
+    return pairs
+
+
+def writeRelBatch(query:str, params:dict)->tuple:
+    """Create one chunk of relationships for createRelBatches in its own 
+    transaction and collect the targets that could not be matched."""
+    records, counters = runQuery("writeRelBatch", query, params, write=True)
+    missing:list = [(r['source'], r['missing']) for r in records]
+    return counters.relationships_created, missing
+
+
+def createRelBatches(source_label:str, relation:str, batch_size:int=500)->dict:
+    """Batched variant of creatRelSet: send batch_size (source, targets) pairs 
+    per explicit write transaction and let the server report, per source, the 
+    targets it could not match. Returns the same target -> sources mapping."""
+    label_dict:dict = label_dicts[source_label]
+    rel_def:dict = label_dict[relation]
+    target_label:str = rel_def['target']
+    logger = f_logger()
+    query:str = """
+                UNWIND $pairs AS pair
+                OPTIONAL MATCH (s:{} {{ {}:pair.source }})
+                UNWIND pair.targets AS target
+                OPTIONAL MATCH (t:{} {{ {}:target.id }})
+                FOREACH (_ IN CASE WHEN s IS NOT NULL AND t IS NOT NULL THEN [1] ELSE [] END |
+                    CREATE (s)-[r:{}]->(t)
+                    SET r = target.props)
+                WITH pair.source AS source, target.id AS target, 
+                     count(CASE WHEN s IS NOT NULL THEN t END) AS hits
+                WHERE hits = 0
+                RETURN source, collect(target) AS missing
+                """.format(source_label, label_dict['key'], 
+                           target_label, label_dicts[target_label]['key'], 
+                           relation)
+    pairs:list[dict] = relationPairs(source_label, relation)
+    labels:dict = {'source_label': source_label, 'source_key': label_dict['key'], 
+                   'target_label': target_label, 'target_key': label_dicts[target_label]['key'], 
+                   'relation': relation}
+    rel_count:int = 0
+    missed_targets:dict = {}
+    for b in range(0, len(pairs), batch_size):
+        created, missing = writeRelBatch(query, dict(labels, pairs=pairs[b:b + batch_size]))
+        rel_count += created
+        logger.success("{} relationships so far.", rel_count)
+        for source, targets in missing:
+            logger.warning("{} was expected but not created for {}.", set(targets), source)
+            for m in targets:
+                missed_targets.setdefault(m, []).append(source)
     return missed_targets
 
 
 def createATUClass(atuClass, superclass):
     """ """
-    graph = openGraph()
-    with graph.session(database="neo4j") as session:
-        _, summary, _ = session.run("""
+    _, counters = runQuery("createATUClass", """
                         CREATE (n:class)
                         SET n = $node
                         WITH n
                         MATCH (s:class { uuid:$super })
                         CREATE (n)-[:superclass {relationGloss: "subclass of", inverseGloss:"superclass of"}]->(s)
-                        """, node=atuClass, super=superclass
-                            ).to_eager_result()
-    graph.close()
-    return summary
+                        """, {'node': atuClass, 'super': superclass})
+    return counters
+
+
+def writeATUClassTree(classes:list[dict], members:list[dict]):
+    """Create the class tree, its superclass links and the memberships of the 
+    ATUs in one write transaction. classes are {'node', 'super'} (the uuid of 
+    the superclass, "" for the root), members are {'atu', 'cls'} (a class uuid)."""
+    _, counters = runQuery("writeATUClassTree", """
+                        UNWIND $classes AS c
+                        CREATE (n:class)
+                        SET n = c.node
+                        WITH collect(n) AS created
+                        UNWIND $classes AS c
+                        MATCH (n:class { uuid:c.node.uuid }), (s:class { uuid:c.super })
+                        CREATE (n)-[:superclass {relationGloss: "subclass of", inverseGloss:"superclass of"}]->(s)
+                        WITH count(*) AS linked
+                        UNWIND $members AS m
+                        MATCH (a:atu { atu:m.atu }), (c:class { uuid:m.cls })
+                        CREATE (a)-[:class {relationGloss: "member of", inverseGloss:"includes"}]->(c)
+                        """, {'classes': classes, 'members': members}, write=True)
+    return counters
+
+
+classify_query:str = """
+                    WITH $atus AS atus
+                    UNWIND atus AS atu
+                    MATCH (a:atu { atu:atu }), (c:class { title:$cls })
+                    CREATE (a)-[:class {relationGloss: "member of", inverseGloss:"includes"}]->(c)
+                    """
 
 
 def classifyATUs(atu_dict:dict):
     """ """
     classified:int = 0
-    graph = openGraph()
     for k, v in atu_dict.items():
-        with graph.session(database="neo4j") as session:
-            _, summary, _ = session.run("""
-                            WITH $atus AS atus
-                            UNWIND atus AS atu
-                            MATCH (a:atu { atu:atu }), (c:class { title:$cls })
-                            CREATE (a)-[:class {relationGloss: "member of", inverseGloss:"includes"}]->(c)
-                            """, atus=v, cls=k
-                                ).to_eager_result()
-            classified += summary.counters.relationships_created
-    graph.close()
+        _, counters = runQuery("classifyATUs", classify_query, {'atus': v, 'cls': k})
+        classified += counters.relationships_created
     return classified
 
 
 def classifyRetiredATUs():
     """ """
     cuuid = str(getUUID())
-    graph = openGraph()
-    with graph.session(database="neo4j") as session:
-        _, summary, _ = session.run("""
+    _, counters = runQuery("classifyRetiredATUs", """
                         CREATE (u:class { title:"Discontinued ATU", uuid: $cuuid } )
                         WITH u
                         MATCH (s:class { title:"ATU" })
@@ -196,23 +652,24 @@ def classifyRetiredATUs():
                         WITH u
                         MATCH (a:atu { description: "Combined with another type as per title." })
                         CREATE (a)-[:class {relationGloss: "member of", inverseGloss:"includes"}]->(u)
-                        """, cuuid=cuuid).to_eager_result()
-        classified:int = summary.counters.relationships_created
-    graph.close()
+                        """, {'cuuid': cuuid})
+    classified:int = counters.relationships_created
     return classified
 
 
-def getRetiredATUs(graph:Driver):
+def getRetiredATUs():
     """ """
-    with graph.session(database="neo4j") as session:
-        results, _, _ = session.run("""
+    results, _ = runQuery("getRetiredATUs", """
                         MATCH (n:class { title:"Discontinued ATU" })<--(a:atu)
                         RETURN a.atu AS discontinued, a.title AS title
-                        """).to_eager_result()
+                        """)
     return results
 
 
-def cleanRetiredATUs(atu_results:list):
+def retiredLinks(atu_results:list)->tuple:
+    """Read the successors of discontinued ATUs from their "See Type..." titles. 
+    Returns the links (discontinued ATU: successor) and the titles that could 
+    not be read reliably."""
     troublemakers:dict = {}
     links:dict = {}
     for result in atu_results:
@@ -232,6 +689,12 @@ def cleanRetiredATUs(atu_results:list):
                 troublemakers[atu] = title
             else:
                 links[atu] = clean_spl.strip(". ")
+    return links, troublemakers
+
+
+def cleanRetiredATUs(atu_results:list):
+    """The links of retiredLinks, saving the troublemakers for review."""
+    links, troublemakers = retiredLinks(atu_results)
     file_name:str = "data/disc_atu_troublemakers.json"
     with open(file_name, 'w', encoding="utf-8") as f:
         dump(troublemakers, f, indent=1, ensure_ascii=False)
@@ -240,77 +703,52 @@ def cleanRetiredATUs(atu_results:list):
 
 def linkRetiredATUs():
     """ """
-    graph = openGraph()
-    links = cleanRetiredATUs(getRetiredATUs(graph))
-    with graph.session(database="neo4j") as session:
-        _, summary, _ = session.run("""
+    links = cleanRetiredATUs(getRetiredATUs())
+    _, counters = runQuery("linkRetiredATUs", """
                         WITH $links as links, keys($links) as ks 
                         UNWIND ks AS k
                         MATCH (d:atu { atu:k }), (a:atu { atu:links[k] })
                         CREATE (d)-[:discontinued {relationGloss: "merged into", inverseGloss:"absorbed"}]->(a)
-                        """, links=links
-                            ).to_eager_result()
-        merged:int = summary.counters.relationships_created
-    graph.close()
+                        """, {'links': links})
+    merged:int = counters.relationships_created
     return merged
 
 
-def getMotifs(graph:Driver):
+def getMotifs():
     """ """
-    with graph.session(database="neo4j") as session:
-        results, _, _ = session.run("""
+    results, _ = runQuery("getMotifs", """
                         MATCH (m:motif)
                         RETURN m.motif AS motif
-                        """).to_eager_result()
+                        """)
     return results
 
 
 def getMotifLinks(motif_results:list):
-    links:dict = {}
-    current_tl:str = ""
-    for result in motif_results:
-        motif:str = result.get('motif')
-        spl:list[str] = motif.split(".")
-        if motif[1] == "0" and len(spl) == 1:
-            current_tl = motif[0]
-            links[current_tl] = {}
-        else:
-            parent:str = ""
-            if len(spl) == 1:
-                parent = spl[0][0] + "0"
-            else:
-                end = -2 if spl[-2] == "0" else -1
-                parent = ".".join(spl[:end])
-            links[current_tl][motif] = parent
-    return links
+    """The parent of every motif, grouped by chapter letter; see motifIndex."""
+    return motifLinks(result.get('motif') for result in motif_results)
 
 
-def linkMotifs():
-    """ """
-    graph = openGraph()
-    all_links:dict = getMotifLinks(getMotifs(graph))
+def linkMotifs(motifs:list[str]=None):
+    """Link every motif to its parent. The codes are read from the graph 
+    unless given, e.g. straight from tmi.json."""
+    all_links:dict = motifLinks(motifs) if motifs is not None else getMotifLinks(getMotifs())
     all_linked:int = 0
     for links in all_links.values():
-        with graph.session(database="neo4j") as session:
-            _, summary, _ = session.run("""
-                            WITH $links as links, keys($links) as ks 
-                            UNWIND ks AS k
-                            MATCH (v:motif { motif:k }), (g:motif { motif:links[k] })
-                            CREATE (v)-[:parent {relationGloss: "variant of", inverseGloss:"has variant"}]->(g)
-                            """, links=links
-                                ).to_eager_result()
-            linked:int = summary.counters.relationships_created
-            all_linked += linked
-    graph.close()
+        _, counters = runQuery("linkMotifs", """
+                        WITH $links as links, keys($links) as ks 
+                        UNWIND ks AS k
+                        MATCH (v:motif { motif:k }), (g:motif { motif:links[k] })
+                        CREATE (v)-[:parent {relationGloss: "variant of", inverseGloss:"has variant"}]->(g)
+                        """, {'links': links})
+        linked:int = counters.relationships_created
+        all_linked += linked
     return all_linked
 
 
 def classifyTraditions(class_title, traditions)->int:
     """ """
     cuuid = str(getUUID())
-    graph = openGraph()
-    with graph.session(database="neo4j") as session:
-        _, summary, _ = session.run("""
+    _, counters = runQuery("classifyTraditions", """
                         CREATE (c:class { title:$class_title, uuid: $cuuid } )
                         WITH c
                         MATCH (s:class {title:"Tradition", uuid:"58e1b5dc-4010-431e-bcf7-d84b62e69d0c"})
@@ -319,18 +757,14 @@ def classifyTraditions(class_title, traditions)->int:
                         UNWIND ts AS trad
                         CREATE (t:tradition {title:trad})
                         CREATE (t)-[:class {relationGloss: "member of", inverseGloss:"includes"}]->(c)
-                        """, cuuid=cuuid, class_title=class_title, traditions=traditions
-                        ).to_eager_result()
-        classified:int = summary.counters.relationships_created
-    graph.close()
+                        """, {'cuuid': cuuid, 'class_title': class_title, 'traditions': traditions})
+    classified:int = counters.relationships_created
     return classified
 
 
 def createCitations(atu:str, atu_refs:dict):
     """ """
-    graph = openGraph()
-    with graph.session(database="neo4j") as session:
-        hits, _, _ = session.run("""
+    hits, _ = runQuery("createCitations", """
                         MATCH (a:atu { atu:$atu } )
                         WITH a, $refs as refs
                         UNWIND keys(refs) AS trad
@@ -345,9 +779,7 @@ def createCitations(atu:str, atu_refs:dict):
                         FOREACH (i in CASE WHEN t IS NOT NULL THEN [1] ELSE [] END |
                                     CREATE (c)-[:tradition {relationGloss: "documents or analyzes", inverseGloss:"is featured in"}]->(t))
                         RETURN r.ref AS ref, t.title AS trad
-                        """, atu=atu, refs=atu_refs
-                        ).to_eager_result()
-    graph.close()
+                        """, {'atu': atu, 'refs': atu_refs})
     parsed:dict = {}
     for hit in hits:
         ref = hit.get('ref')
@@ -360,79 +792,100 @@ def createCitations(atu:str, atu_refs:dict):
     return parsed
 
 
+def writeCitationBatch(batch:list[dict])->list:
+    """Write the citations of createCitationsBatch in one transaction. Rows 
+    are (position of the item in batch, tradition, refs)."""
+    records, _ = runQuery("writeCitationBatch", """
+                    UNWIND range(0, size($batch) - 1) AS i
+                    WITH i, $batch[i] AS item
+                    MATCH (a:atu { atu:item.atu } )
+                    WITH a, i, item.refs AS refs
+                    UNWIND keys(refs) AS trad
+                    OPTIONAL MATCH (t:tradition { title: trad })
+                    WITH a, i, t, refs[trad] AS refs
+                    UNWIND refs as ref
+                    MATCH (r:ref {ref: ref.citation} )
+                    WITH a, i, t, r, ref
+                    CREATE (a)-[:literature {relationGloss: "has relevant literature", inverseGloss:"concerns or features"}]->
+                                (c:citation:EXP {from: ref.raw})-[:reference {relationGloss: "full citation", inverseGloss:"cited as"}]->(r)
+                    WITH i, c, r, t
+                    FOREACH (x in CASE WHEN t IS NOT NULL THEN [1] ELSE [] END |
+                                CREATE (c)-[:tradition {relationGloss: "documents or analyzes", inverseGloss:"is featured in"}]->(t))
+                    RETURN i, t.title AS trad, collect(r.ref) AS refs
+                    """, {'batch': batch}, write=True)
+    return [(r['i'], r['trad'], r['refs']) for r in records]
+
+
+def createCitationsBatch(batch:list[dict])->list[dict]:
+    """Batch variant of createCitations: write the citations of many ATUs, 
+    given as {'atu': ..., 'refs': atu_refs} items, in one transaction. Returns 
+    the created refs per tradition, in createCitations' shape, for each item 
+    in order, so that an ATU listed twice keeps both results."""
+    hits:list = writeCitationBatch(batch)
+    parsed:list[dict] = [{} for _ in batch]
+    for i, trad, refs in hits:
+        k = trad if trad is not None else 'cf'
+        parsed[i].setdefault(k, []).extend(refs)
+    return parsed
+
+
 def removeCitations():
     """ """
-    graph = openGraph()
-    with graph.session(database="neo4j") as session:
-        _, summary, _ = session.run("""
+    _, counters = runQuery("removeCitations", """
                                     MATCH (ts:tradition)
                                     UNWIND ts as t
                                     MATCH (c:citation)-->(t) DETACH DELETE c
                                     MATCH (uc:citation) DETACH DELETE uc
-                                    """).to_eager_result()
-    graph.close()
-    return summary.counters.nodes_deleted
+                                    """)
+    return counters.nodes_deleted
 
 
 def fixCitations(fixes):
     """ """
-    graph = openGraph()
-    with graph.session(database="neo4j") as session:
-        _, summary, _ = session.run("""
+    _, counters = runQuery("fixCitations", """
                                     WITH $fixes as fixes
                                     UNWIND keys(fixes) AS fix
                                     MATCH (r:ref { ref:fix })
                                     SET r.ref = fixes[fix]
-                                    """, fixes=fixes).to_eager_result()
-    graph.close()
-    return summary.counters.properties_set
+                                    """, {'fixes': fixes})
+    return counters.properties_set
 
 
 def createAndLinkSubjects(main:str, subs:dict)->int:
     """ """
     muuid:str = str(getUUID())
-    graph = openGraph()
     rels:int = 0
-    with graph.session(database="neo4j") as session:
-        session.run("CREATE (m:subject { title:$main, uuid: $muuid } )", 
-                    main=main, muuid=muuid)
-        for k, v in subs.items():
-            suuid = str(getUUID())
-            _, summary, _ = session.run("""
-                            MATCH (m:subject { uuid: $muuid } )
-                            CREATE (s:subject { title:$sub, uuid: $suuid })-[:parent {relationGloss: "variant of", inverseGloss:"has variant"}]->(m)
-                            WITH s, $atus as atus
-                            UNWIND atus AS atu
-                            MATCH (a:atu {atu:atu})
-                            CREATE (a)-[:subject {relationGloss: "involves subject", inverseGloss:"appears in type"}]->(s)
-                            """, muuid=muuid, suuid=suuid, sub=k, atus=v
-                            ).to_eager_result()
-            classified:int = summary.counters.relationships_created
-            rels += classified
-    graph.close()
+    runQuery("createSubject", "CREATE (m:subject { title:$main, uuid: $muuid } )", 
+             {'main': main, 'muuid': muuid})
+    for k, v in subs.items():
+        suuid = str(getUUID())
+        _, counters = runQuery("linkSubjectEntry", """
+                        MATCH (m:subject { uuid: $muuid } )
+                        CREATE (s:subject { title:$sub, uuid: $suuid })-[:parent {relationGloss: "variant of", inverseGloss:"has variant"}]->(m)
+                        WITH s, $atus as atus
+                        UNWIND atus AS atu
+                        MATCH (a:atu {atu:atu})
+                        CREATE (a)-[:subject {relationGloss: "involves subject", inverseGloss:"appears in type"}]->(s)
+                        """, {'muuid': muuid, 'suuid': suuid, 'sub': k, 'atus': v})
+        classified:int = counters.relationships_created
+        rels += classified
     return rels
 
 
 def createRemarks(remarks:dict):
     """ """
-    graph = openGraph()
-    with graph.session(database="neo4j") as session:
-        _, summary, _ = session.run("""
+    _, counters = runQuery("createRemarks", """
                         WITH $remarks as remarks
                         UNWIND keys(remarks) AS atu
                         MATCH (a:atu { atu: atu })
                         SET a.remarks = remarks[atu]
-                        """, remarks=remarks
-                        ).to_eager_result()
-    graph.close()
-    return {'expected': len(remarks), 'created': summary.counters.properties_set}
+                        """, {'remarks': remarks})
+    return {'expected': len(remarks), 'created': counters.properties_set}
 
 
 def linkCombos(combos:dict):
     """ """
-    graph = openGraph()
-    with graph.session(database="neo4j") as session:
-        _, summary, _ = session.run("""
+    _, counters = runQuery("linkCombos", """
                         WITH $combos as combos
                         UNWIND keys(combos) AS atu0
                         WITH atu0, combos
@@ -440,28 +893,22 @@ def linkCombos(combos:dict):
                         MATCH (s:atu { atu: atu0 })
                         MATCH (t:atu { atu: atu1 })
                         MERGE (s)-[:combo {relationGloss: "sometimes combined with", inverseGloss:"sometimes combined with"}]-(t)
-                        """, combos=combos
-                        ).to_eager_result()
-    graph.close()
-    return summary.counters.relationships_created
+                        """, {'combos': combos})
+    return counters.relationships_created
 
 
 def linkSubjects(source:str, targets:list[str]):
     """ """
     redundancies:dict = {}
-    graph = openGraph()
-    with graph.session(database="neo4j") as session:
-        matches, summary, _ = session.run("""
+    matches, counters = runQuery("linkSubjects", """
                         WITH $source AS subj0, $targets AS targets
                         UNWIND targets AS subj1
                         MATCH (s:subject { title: subj0 })
                         MATCH (t:subject { title: subj1 })
                         MERGE (s)-[:see {relationGloss: "see also", inverseGloss:"see also"}]-(t)
                         RETURN s.title AS source, t.title AS target
-                        """, source=source, targets=targets
-                        ).to_eager_result()
-    graph.close()
+                        """, {'source': source, 'targets': targets})
     if matches:
         for match in matches:
             redundancies[match.get('target')] = match.get('source')
-    return summary.counters.relationships_created, redundancies
\ No newline at end of file
+    return counters.relationships_created, redundancies
\ No newline at end of file
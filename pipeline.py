@@ -0,0 +1,238 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from hashlib import sha256
+from importlib import import_module
+from json import dump, load
+from os import path, replace, stat
+from time import perf_counter
+from datetime import datetime as time
+from log import f_logger
+
+
+# The build as a DAG. Each stage names the function that runs it, the files it
+# reads and writes, and any stages it must follow besides those that produce its
+# inputs. File stages only parse; graph stages write to the active backend.
+# Journaled stages take resume: they skip the batches their journal records as
+# committed, which is only right when picking up an interrupted run of the same
+# fingerprint, so every other run starts them with resume=False.
+# Hand-reviewed files (atu.json from atus_<date>.json, subjects.tsv from
+# subjects2.tsv, and likewise citations.json, traditions.json, subjects.json
+# and tmi_refs.json from their *_parsed.json) are plain inputs, so editing them
+# reruns what depends on them; no stage ever writes them.
+stages:dict = {
+    'parse-atus': {'run': "parsing:atuParser", 'graph': False,
+                   'inputs': ["data/ATU1.pdf", "data/ATU2.pdf"], 'outputs': []},
+    'parse-traditions': {'run': "parsing:tradsParser", 'graph': False,
+                         'inputs': ["data/ATU3.pdf"], 'outputs': ["data/traditions_parsed.json"]},
+    'parse-sources': {'run': "parsing:sourcesParser", 'graph': False,
+                      'inputs': ["data/ATU3.pdf"], 'outputs': ["data/citations_parsed.json"]},
+    'parse-subjects': {'run': "parsing:parseSubjects2tsv", 'graph': False,
+                       'inputs': ["data/ATU3.pdf"], 'outputs': ["data/subjects2.tsv"]},
+    'subjects-json': {'run': "parsing:parseSubjects2json", 'graph': False,
+                      'inputs': ["data/subjects.tsv"], 'outputs': ["data/subjects_parsed.json"]},
+    'tmi-refs': {'run': "parsing:buildTMIrefs", 'graph': False,
+                 'inputs': ["data/motifs_refs.txt"], 'outputs': ["data/tmi_refs_parsed.json"]},
+    'tmi-traditions': {'run': "parsing:collectMotifReferenceElements", 'graph': False,
+                       'inputs': ["data/tmi.json"], 'outputs': ["data/tmi_trads.json"]},
+    'atu-nodes': {'run': "neo4jUtils:streamNodeSet", 'args': ["atu"], 'graph': True, 'journaled': True,
+                  'inputs': ["data/atu.json"]},
+    'ref-nodes': {'run': "neo4jUtils:streamNodeSet", 'args': ["ref"], 'graph': True, 'journaled': True,
+                  'inputs': ["data/citations.json"]},
+    'motif-nodes': {'run': "neo4jUtils:streamNodeSet", 'args': ["motif"], 'graph': True, 'journaled': True,
+                    'inputs': ["data/tmi.json"]},
+    'atu-motifs': {'run': "neo4jUtils:createRelBatches", 'args': ["atu", "motifs"], 'graph': True,
+                   'inputs': ["data/atu.json"], 'after': ["atu-nodes", "motif-nodes"]},
+    'classes': {'run': "parsing:createATUClasses", 'graph': True,
+                'inputs': ["data/ATU_outline.txt", "data/atu.json"], 'after': ["atu-nodes"]},
+    'retire-atus': {'run': "neo4jUtils:classifyRetiredATUs", 'graph': True,
+                    'inputs': [], 'after': ["classes", "atu-nodes"]},
+    'merge-atus': {'run': "neo4jUtils:linkRetiredATUs", 'graph': True,
+                   'inputs': [], 'after': ["retire-atus"]},
+    'link-motifs': {'run': "neo4jUtils:linkMotifs", 'graph': True,
+                    'inputs': [], 'after': ["motif-nodes"]},
+    'traditions': {'run': "parsing:createTraditions", 'graph': True,
+                   'inputs': ["data/traditions.json"]},
+    'citations': {'run': "parsing:attachATUs2Citations", 'graph': True, 'journaled': True,
+                  'inputs': ["data/atu.json"], 'after': ["atu-nodes", "ref-nodes", "traditions"]},
+    'subjects': {'run': "parsing:createNeo4jSubjects", 'graph': True,
+                 'inputs': ["data/subjects.json"], 'after': ["atu-nodes"]},
+    'subject-links': {'run': "parsing:extractSubjectCfs", 'graph': True,
+                      'inputs': ["data/subjects.json"], 'after': ["subjects"]},
+    'remarks': {'run': "parsing:extractRemarks", 'graph': True,
+                'inputs': ["data/atu.json"], 'after': ["atu-nodes"]},
+    'combos': {'run': "parsing:extractCombos", 'graph': True,
+               'inputs': ["data/atu.json"], 'after': ["atu-nodes"]},
+                }
+
+state_file:str = "data/.pipeline_state.json"
+
+
+def readState(file_name:str=state_file)->dict:
+    if not path.exists(file_name):
+        return {'files': {}, 'stages': {}}
+    with open(file_name, "r", encoding='utf-8') as f:
+        return load(f)
+
+
+def writeState(state:dict, file_name:str=state_file):
+    """Save the state atomically, so an interrupted run keeps what finished."""
+    with open(file_name + ".tmp", 'w', encoding="utf-8") as f:
+        dump(state, f, indent=1, ensure_ascii=False)
+    replace(file_name + ".tmp", file_name)
+
+
+def fileHash(file_name:str, state:dict)->str:
+    """SHA-256 of a file's content. Hashes are kept in the state by size and
+    mtime, so unchanged files (the PDFs above all) are not read again."""
+    st = stat(file_name)
+    known:dict = state['files'].get(file_name)
+    if known is not None and known['mtime_ns'] == st.st_mtime_ns and known['size'] == st.st_size:
+        return known['sha256']
+    h = sha256()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    state['files'][file_name] = {'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'sha256': h.hexdigest()}
+    return h.hexdigest()
+
+
+def dependencies(name:str)->list[str]:
+    """The stages that produce a stage's inputs, plus those it is declared to follow."""
+    stage:dict = stages[name]
+    producers:list[str] = [k for k, s in stages.items()
+                           if k != name and set(s.get('outputs', [])) & set(stage['inputs'])]
+    return list(dict.fromkeys(producers + stage.get('after', [])))
+
+
+def requiredStages(targets:list[str])->list[str]:
+    """The targets and everything upstream of them, in dependency order."""
+    ordered:list[str] = []
+
+    def visit(name:str, trail:tuple):
+        if name in trail:
+            raise ValueError("Stage cycle: {}".format(" -> ".join(trail + (name,))))
+        if name in ordered:
+            return
+        for d in dependencies(name):
+            visit(d, trail + (name,))
+        ordered.append(name)
+
+    for t in targets:
+        if t not in stages:
+            raise KeyError("Unknown stage: {}".format(t))
+        visit(t, ())
+    return ordered
+
+
+def fingerprint(name:str, state:dict, backend:str)->str:
+    """Hash of what a stage's result depends on: its function and arguments,
+    the content of its inputs and the fingerprints its dependencies ran with."""
+    stage:dict = stages[name]
+    h = sha256("{} {} {}".format(stage['run'], stage.get('args', []), backend if stage['graph'] else "").encode())
+    for file_name in stage['inputs']:
+        h.update("{}={}".format(file_name, fileHash(file_name, state)).encode())
+    for d in dependencies(name):
+        h.update("{}={}".format(d, state['stages'].get(d, {}).get('fingerprint')).encode())
+    return h.hexdigest()
+
+
+def upToDate(name:str, digest:str, state:dict)->bool:
+    done:dict = state['stages'].get(name)
+    return (done is not None and done['fingerprint'] == digest
+            and all(path.exists(o) for o in stages[name].get('outputs', [])))
+
+
+def runStage(name:str, resume:bool=False)->tuple:
+    """Import and call a stage's function; runs in a worker process for file 
+    stages. resume is passed on to journaled stages."""
+    module, function = stages[name]['run'].split(":")
+    options:dict = {'resume': resume} if stages[name].get('journaled') else {}
+    start:float = perf_counter()
+    result = getattr(import_module(module), function)(*stages[name].get('args', []), **options)
+    return name, repr(result)[:200], perf_counter() - start
+
+
+def runPipeline(targets:list[str]=None, workers:int=None, force:list[str]=None,
+                dry_run:bool=False, touch:bool=False)->dict:
+    """Bring the targets (by default every stage) up to date. A stage runs when
+    its fingerprint differs from the one it last ran with, or when forced.
+    File stages that do not depend on each other run in parallel worker
+    processes; graph stages run one at a time in this process, alongside them.
+    Graph stages add to the graph rather than replace what is there, so a
+    changed graph stage should be rerun against a fresh database. touch records
+    the current fingerprints without running anything, for a tree that was
+    built by hand. A journaled stage resumes from its journal only if its last
+    run was interrupted with the same fingerprint. Returns each stage's outcome."""
+    from neo4jUtils import graph_backend
+    logger = f_logger()
+    backend:str = graph_backend['name']
+    order:list[str] = requiredStages(targets or list(stages))
+    force = set(force or [])
+    state:dict = readState()
+    started:dict = state.setdefault('started', {})
+    outcome:dict = {}
+    running:dict = {}
+    process_pool = ProcessPoolExecutor(max_workers=workers)
+    graph_lane = ThreadPoolExecutor(max_workers=1)
+
+    def settle(name:str, status:str):
+        outcome[name] = status
+        logger.success("{}: {}", name, status)
+
+    try:
+        while len(outcome) < len(order):
+            for name in order:
+                if name in outcome or name in [n for n, _ in running.values()]:
+                    continue
+                deps:list[str] = dependencies(name)
+                if any(outcome.get(d) in ("failed", "blocked") for d in deps):
+                    settle(name, "blocked")
+                    continue
+                if not all(d in outcome for d in deps):
+                    continue
+                missing:list[str] = [i for i in stages[name]['inputs'] if not path.exists(i)]
+                if missing:
+                    logger.warning("{} cannot run without {}.", name, missing)
+                    settle(name, "blocked")
+                    continue
+                digest:str = fingerprint(name, state, backend)
+                stale:bool = dry_run and any(outcome[d] == "would run" for d in deps)
+                if upToDate(name, digest, state) and name not in force and not stale:
+                    settle(name, "up to date")
+                    continue
+                # The memory graph does not outlive the process, so its stages are never recorded.
+                recorded:bool = not (stages[name]['graph'] and backend == "memory")
+                if dry_run or touch:
+                    if touch and recorded:
+                        state['stages'][name] = {'fingerprint': digest, 'when': time.now().isoformat(timespec="seconds")}
+                    settle(name, "would run" if dry_run else "touched")
+                    continue
+                resume:bool = recorded and started.get(name) == digest and name not in force
+                if recorded:
+                    started[name] = digest
+                    writeState(state)
+                pool = graph_lane if stages[name]['graph'] else process_pool
+                running[pool.submit(runStage, name, resume)] = (name, digest)
+            if not running:
+                continue
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name, digest = running.pop(fut)
+                try:
+                    _, result, seconds = fut.result()
+                except Exception as e:
+                    logger.error("{} failed: {!r}", name, e)
+                    settle(name, "failed")
+                    continue
+                if not (stages[name]['graph'] and backend == "memory"):
+                    started.pop(name, None)
+                    state['stages'][name] = {'fingerprint': digest,
+                                             'when': time.now().isoformat(timespec="seconds"),
+                                             'seconds': round(seconds, 3), 'result': result}
+                    writeState(state)
+                settle(name, "ran in {:.1f}s".format(seconds))
+    finally:
+        process_pool.shutdown(cancel_futures=True)
+        graph_lane.shutdown(cancel_futures=True)
+        if not dry_run:
+            writeState(state)
+    return outcome
@@ -0,0 +1,205 @@
+from json import dumps, loads
+from os import makedirs, path, remove, replace
+from threading import local
+import sqlite3
+import memoryGraph
+
+
+# An embedded, read-only copy of the graph for local browsing without a Neo4j
+# server. It is built by loading the same JSON inputs into the memory graph,
+# then written out as nodes (with every label), typed edges carrying their
+# glosses, and FTS5 tables over ATU titles, descriptions and remarks and over
+# citation text. runQuery reads from it when the backend is "sqlite", so the
+# read statements of neo4jUtils (getRetiredATUs, getMotifs) work unchanged.
+# Functions taking file_name=None read sqlite_file when they are called, so
+# setting it points the sqlite backend at another store.
+sqlite_file:str = "data/tomes.sqlite"
+
+# The property that names a node of each label, stored in nodes.key.
+node_keys:dict = {'atu': "atu", 'motif': "motif", 'ref': "ref", 'class': "title",
+                  'tradition': "title", 'subject': "title"}
+
+# The Tradition class is not created by any stage; in Neo4j it already exists.
+tradition_root:dict = {'title': "Tradition", 'uuid': "58e1b5dc-4010-431e-bcf7-d84b62e69d0c"}
+
+store_schema:list[str] = [
+    """CREATE TABLE nodes (id INTEGER PRIMARY KEY, label TEXT NOT NULL, key TEXT,
+                           props TEXT NOT NULL)""",
+    "CREATE INDEX nodes_label_key ON nodes (label, key)",
+    """CREATE TABLE node_labels (node INTEGER NOT NULL, label TEXT NOT NULL,
+                                 PRIMARY KEY (node, label)) WITHOUT ROWID""",
+    "CREATE INDEX node_labels_label ON node_labels (label, node)",
+    """CREATE TABLE edges (id INTEGER PRIMARY KEY, type TEXT NOT NULL,
+                           start INTEGER NOT NULL, end INTEGER NOT NULL,
+                           relationGloss TEXT, inverseGloss TEXT, props TEXT NOT NULL)""",
+    "CREATE INDEX edges_start ON edges (start, type)",
+    "CREATE INDEX edges_end ON edges (end, type)",
+    "CREATE VIRTUAL TABLE atu_text USING fts5 (atu UNINDEXED, title, description, remarks)",
+    "CREATE VIRTUAL TABLE citation_text USING fts5 (label UNINDEXED, key UNINDEXED, text)",
+                ]
+
+connections = local()
+
+
+def buildSQLiteStore(file_name:str=None)->dict:
+    """Run every graph stage of the pipeline whose inputs exist against a fresh
+    memory graph and write the result to file_name. Returns the graph's stats."""
+    from contextlib import redirect_stdout
+    from io import StringIO
+    from neo4jUtils import useBackend, graph_backend
+    from pipeline import stages, requiredStages, runStage
+    previous:str = graph_backend['name']
+    useBackend("memory")
+    try:
+        memoryGraph.createNode(["class"], tradition_root, memoryGraph.memoryCounters())
+        for name in requiredStages(list(stages)):
+            if stages[name]['graph'] and all(path.exists(i) for i in stages[name]['inputs']):
+                with redirect_stdout(StringIO()):
+                    runStage(name)
+        writeSQLiteStore(file_name or sqlite_file)
+        return memoryGraph.graphStats()
+    finally:
+        useBackend(previous, reset=False)
+
+
+def writeSQLiteStore(file_name:str=None):
+    """Write the memory graph to a new SQLite file, replacing file_name at the end."""
+    file_name = file_name or sqlite_file
+    graph:dict = memoryGraph.memory_graph
+    makedirs(path.dirname(file_name) or ".", exist_ok=True)
+    if path.exists(file_name + ".tmp"):
+        remove(file_name + ".tmp")
+    con = sqlite3.connect(file_name + ".tmp")
+    with con:
+        for statement in store_schema:
+            con.execute(statement)
+        con.executemany("INSERT INTO nodes VALUES (?, ?, ?, ?)",
+                        ((n, d['labels'][0], d['props'].get(node_keys.get(d['labels'][0])),
+                          dumps(d['props'], ensure_ascii=False)) for n, d in graph['nodes'].items()))
+        con.executemany("INSERT INTO node_labels VALUES (?, ?)",
+                        ((n, l) for n, d in graph['nodes'].items() for l in d['labels']))
+        con.executemany("INSERT INTO edges VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        ((r, e['type'], e['start'], e['end'], e['props'].get('relationGloss'),
+                          e['props'].get('inverseGloss'), dumps(e['props'], ensure_ascii=False))
+                         for r, e in graph['rels'].items()))
+        con.executemany("INSERT INTO atu_text (rowid, atu, title, description, remarks) VALUES (?, ?, ?, ?, ?)",
+                        ((n, p.get('atu'), p.get('title'), p.get('description'), p.get('remarks'))
+                         for n in memoryGraph.matchNodes("atu")
+                         for p in [graph['nodes'][n]['props']]))
+        con.executemany("INSERT INTO citation_text (rowid, label, key, text) VALUES (?, ?, ?, ?)",
+                        [(n, "ref", memoryGraph.prop(n, "ref"), memoryGraph.prop(n, "citation"))
+                         for n in memoryGraph.matchNodes("ref")] +
+                        [(n, "citation", None, memoryGraph.prop(n, "from"))
+                         for n in memoryGraph.matchNodes("citation")])
+        con.execute("INSERT INTO atu_text (atu_text) VALUES ('optimize')")
+        con.execute("INSERT INTO citation_text (citation_text) VALUES ('optimize')")
+        con.execute("ANALYZE")
+    con.execute("VACUUM")
+    con.close()
+    closeStore(file_name)
+    replace(file_name + ".tmp", file_name)
+
+
+def dictRow(cursor, row)->dict:
+    return {d[0]: v for d, v in zip(cursor.description, row)}
+
+
+def storeConnection(file_name:str=None)->sqlite3.Connection:
+    """This thread's read-only connection to the store."""
+    file_name = file_name or sqlite_file
+    con = getattr(connections, file_name, None)
+    if con is None:
+        if not path.exists(file_name):
+            raise FileNotFoundError("No SQLite store at {}; build it with buildSQLiteStore().".format(file_name))
+        con = sqlite3.connect("file:{}?mode=ro".format(file_name), uri=True)
+        con.row_factory = dictRow
+        con.execute("PRAGMA mmap_size = 268435456")
+        setattr(connections, file_name, con)
+    return con
+
+
+def closeStore(file_name:str=None):
+    file_name = file_name or sqlite_file
+    con = getattr(connections, file_name, None)
+    if con is not None:
+        con.close()
+        delattr(connections, file_name)
+
+
+def storeQuery(query:str, params:tuple=(), file_name:str=None)->list[dict]:
+    return storeConnection(file_name).execute(query, params).fetchall()
+
+
+def getRetiredATUs(p:dict, file_name:str=None)->list:
+    return storeQuery("""
+                      SELECT a.key AS discontinued, json_extract(a.props, '$.title') AS title
+                      FROM nodes c JOIN edges e ON e.end = c.id JOIN node_labels l ON l.node = e.start
+                      JOIN nodes a ON a.id = e.start
+                      WHERE c.label = 'class' AND c.key = 'Discontinued ATU' AND l.label = 'atu'
+                      """, file_name=file_name)
+
+
+def getMotifs(p:dict, file_name:str=None)->list:
+    return storeQuery("SELECT n.key AS motif FROM node_labels l JOIN nodes n ON n.id = l.node WHERE l.label = 'motif'",
+                      file_name=file_name)
+
+
+def getNode(label:str, key:str, file_name:str=None)->list[dict]:
+    """Every node of a label with this key (an ATU number, a ref, a title),
+    as {'id', 'labels', 'props'}."""
+    return [{'id': r['id'], 'labels': r['labels'].split(","), 'props': loads(r['props'])}
+            for r in storeQuery("""
+                                SELECT n.id, n.props, (SELECT group_concat(label) FROM node_labels
+                                                       WHERE node = n.id) AS labels
+                                FROM nodes n WHERE n.label = ? AND n.key = ?
+                                """, (label, key), file_name)]
+
+
+def getRelated(node:int, rel_type:str=None, file_name:str=None)->list[dict]:
+    """The neighbours of a node, each with the gloss read in its direction:
+    the relationGloss of outgoing edges and the inverseGloss of incoming ones."""
+    return storeQuery("""
+                      SELECT e.type, e.relationGloss AS gloss, n.id, n.label, n.key
+                      FROM edges e JOIN nodes n ON n.id = e.end
+                      WHERE e.start = :node AND (:type IS NULL OR e.type = :type)
+                      UNION ALL
+                      SELECT e.type, e.inverseGloss AS gloss, n.id, n.label, n.key
+                      FROM edges e JOIN nodes n ON n.id = e.start
+                      WHERE e.end = :node AND (:type IS NULL OR e.type = :type)
+                      """, {'node': node, 'type': rel_type}, file_name)
+
+
+def searchATUs(text:str, limit:int=20, file_name:str=None)->list[dict]:
+    """ATUs whose title, description or remarks match an FTS5 query, best first."""
+    return storeQuery("""
+                      SELECT atu, title, snippet(atu_text, -1, '[', ']', '…', 12) AS snippet
+                      FROM atu_text WHERE atu_text MATCH ? ORDER BY rank LIMIT ?
+                      """, (text, limit), file_name)
+
+
+def searchCitations(text:str, limit:int=20, file_name:str=None)->list[dict]:
+    """References and citations whose text matches an FTS5 query, best first."""
+    return storeQuery("""
+                      SELECT rowid AS id, label, key, text FROM citation_text
+                      WHERE citation_text MATCH ? ORDER BY rank LIMIT ?
+                      """, (text, limit), file_name)
+
+
+# The read statements of neo4jUtils that the store can answer, by name. These
+# are all of them: every other statement of neo4jUtils writes to the graph.
+operations:dict = {
+    'getRetiredATUs': getRetiredATUs,
+    'getMotifs': getMotifs,
+                }
+
+# The write statements of neo4jUtils, which the store refuses.
+unsupported:list[str] = [name for name in memoryGraph.operations if name not in operations]
+
+
+def runOperation(name:str, params:dict)->tuple:
+    """Answer a named read statement from the store; it cannot be written to."""
+    if name in unsupported:
+        raise KeyError("The SQLite store is read-only; {} writes to the graph. Load it with the neo4j or memory backend.".format(name))
+    if name not in operations:
+        raise KeyError("The SQLite store does not answer {}; it answers {}.".format(name, ", ".join(operations)))
+    return operations[name](params), memoryGraph.memoryCounters()
@@ -0,0 +1,5 @@
+from os import path
+import sys
+
+# The modules under test live at the repository root and import each other by bare name.
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
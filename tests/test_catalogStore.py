@@ -0,0 +1,100 @@
+from os import path, stat, utime
+from shutil import copyfile
+import gzip
+import pytest
+import requests
+import catalogStore
+
+
+fixture:str = path.join(path.dirname(path.abspath(__file__)), "fixtures", "pg_catalog.csv.gz")
+
+
+class FakeResponse:
+    """Enough of a streamed requests.Response for fetchCatalog."""
+
+    def __init__(self, status_code:int, body:bytes=b"", headers:dict=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(self.status_code)
+
+    def iter_content(self, size:int):
+        for i in range(0, len(self.body), size):
+            yield self.body[i:i + size]
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    """A private copy of the fixture catalog, served as a file:// mirror, with
+    the store and the logs kept under tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    source = tmp_path / "mirror" / "pg_catalog.csv.gz"
+    source.parent.mkdir()
+    copyfile(fixture, source)
+    monkeypatch.setitem(catalogStore.catalog_settings, 'dir', str(tmp_path / "catalog"))
+    monkeypatch.setitem(catalogStore.catalog_settings, 'url', source.as_uri())
+    return source
+
+
+def test_file_mirror_refresh(mirror):
+    catalog = catalogStore.loadCatalog()
+    assert len(catalog) == 10
+    assert list(catalog.columns) == catalogStore.catalog_settings['columns']
+    assert str(catalog['LoCC'].dtype) == "category"
+    assert list(catalog['LoCC'].dropna().unique()) == ["PZ", "GR", "PT", "PQ"]
+    assert catalog.loc[catalog['Text#'] == 2400, 'Title'].item() == "Kinder- und Hausmärchen\nBand 1"
+    table:str = catalogStore.catalogPath("pg_catalog.parquet")
+    written:int = stat(table).st_mtime_ns
+    assert len(catalogStore.loadCatalog(refresh=True)) == 10
+    assert stat(table).st_mtime_ns == written
+    with gzip.open(fixture, 'rb') as f:
+        lines:list[bytes] = f.read().splitlines(keepends=True)
+    with gzip.open(mirror, 'wb') as f:
+        f.writelines(lines[:4])
+    utime(mirror, ns=(written + 10**9, written + 10**9))
+    assert len(catalogStore.loadCatalog(refresh=True)) == 3
+
+
+def test_http_not_modified(mirror, monkeypatch):
+    with open(fixture, 'rb') as f:
+        body:bytes = f.read()
+    calls:list[dict] = []
+
+    def get(url, headers=None, **kwargs):
+        calls.append(headers)
+        if headers.get('If-None-Match') == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, body, {'ETag': '"v1"', 'Last-Modified': "Sat, 17 Oct 2026 00:00:00 GMT"})
+
+    monkeypatch.setitem(catalogStore.catalog_settings, 'url', "https://mirror.invalid/pg_catalog.csv.gz")
+    monkeypatch.setattr(catalogStore.requests, "get", get)
+    assert len(catalogStore.loadCatalog()) == 10
+    assert calls == [{}]
+    table:str = catalogStore.catalogPath("pg_catalog.parquet")
+    written:int = stat(table).st_mtime_ns
+    assert len(catalogStore.loadCatalog(refresh=True)) == 10
+    assert calls[1] == {'If-None-Match': '"v1"', 'If-Modified-Since': "Sat, 17 Oct 2026 00:00:00 GMT"}
+    assert stat(table).st_mtime_ns == written
+
+
+def test_offline_fallback(mirror, monkeypatch):
+    assert len(catalogStore.loadCatalog()) == 10
+
+    def get(url, **kwargs):
+        raise requests.ConnectionError("no network")
+
+    monkeypatch.setitem(catalogStore.catalog_settings, 'url', "https://mirror.invalid/pg_catalog.csv.gz")
+    monkeypatch.setattr(catalogStore.requests, "get", get)
+    assert len(catalogStore.loadCatalog(refresh=True)) == 10
+    monkeypatch.setitem(catalogStore.catalog_settings, 'dir', str(mirror.parent.parent / "empty"))
+    with pytest.raises(requests.ConnectionError):
+        catalogStore.loadCatalog()